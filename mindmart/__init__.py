@@ -0,0 +1,31 @@
+"""
+MindMart recommendation engine.
+
+Importing this package has no side effects: configuration is read from the environment
+(see mindmart.config) and the Snowflake session pool is created on first use, so the
+functions below can be called from the Streamlit app and from batch jobs alike.
+"""
+
+from .auth import hash_password, login_user, register_user
+from .catalog import get_home_feed, get_random_products, get_user_history_products, warm_home_feed
+from .config import ADMIN_PANEL, GRID_PAGE_SIZE, LOG_LEVEL, SNOWFLAKE_CONFIG
+from .connection import SessionPool, get_session, get_session_pool
+from .images import prefetch_thumbnails, thumbnail_src
+from .interactions import flush_interactions, log_interaction
+from .pipeline import (
+    bump_profile_version,
+    construct_context,
+    fetch_recommendations,
+    get_profile_version,
+    get_recommendations,
+    perform_semantic_search,
+    run_recommendation_pipeline,
+    stream_recommendations,
+)
+from .profiles import backfill_user_profiles, update_user_profiles
+from .rewrite import get_mistral_query, rewrite_cache_stats
+from .schema import PRODUCT_SCHEMA, apply_product_schema
+from .search import ensure_cortex_search_service
+from .statements import STATEMENTS, execute_statement, statement_stats
+from .tables import cleanup_tables, pipeline_tables
+from .tracing import recent_traces
@@ -0,0 +1,53 @@
+"""User registration and login."""
+
+import hashlib
+
+from .cache import TTLCache
+from .statements import execute_statement
+
+# Verified logins are remembered for a few minutes, keyed by username and password hash,
+# so the reruns that follow a login (and repeated logins during spikes) skip the warehouse.
+LOGIN_CACHE_SIZE = 10000
+LOGIN_CACHE_TTL = 300
+
+_login_cache = TTLCache(max_size=LOGIN_CACHE_SIZE, ttl=LOGIN_CACHE_TTL)
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def login_user(session, username, password):
+    password_hash = hash_password(password)
+    key = (username, password_hash)
+    user_id = _login_cache.get(key)
+    if user_id is not None:
+        return user_id
+
+    result = execute_statement(session, "login_user", [username, password_hash])
+    if not result:
+        return None
+
+    user_id = result[0]['USER_ID']
+    _login_cache.set(key, user_id)
+    return user_id
+
+def register_user(session, username, email, password):
+    """
+    Registers a user in a single MERGE, which inserts the row only if neither the username
+    nor the email is taken. Concurrent sign-ups for the same name cannot both succeed,
+    since Snowflake serializes MERGEs into the same table.
+
+    Returns:
+        True on success, otherwise an error message.
+    """
+    try:
+        password_hash = hash_password(password)
+        result = execute_statement(session, "register_user", [username, email, password_hash])
+
+        # MERGE returns the number of inserted rows
+        if not result or result[0][0] == 0:
+            return "Username or email already exists"
+        return True
+
+    except Exception as e:
+        return str(e)
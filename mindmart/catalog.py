@@ -0,0 +1,200 @@
+"""Product lists for the home feed."""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .cache import TTLCache
+from .connection import get_session
+from .schema import apply_product_schema
+from .statements import execute_statement
+from .tracing import run_query
+
+logger = logging.getLogger(__name__)
+
+# Random home-feed products are drawn from a pool of RANDOM_POOL_SIZE products sampled
+# from the catalog every RANDOM_POOL_REFRESH_INTERVAL seconds and shared by all sessions
+# of the process, so filling a feed costs O(n) in the products shown, not in the catalog.
+RANDOM_POOL_SIZE = 1000
+RANDOM_POOL_REFRESH_INTERVAL = 600
+
+_random_pool = None
+_random_pool_loaded_at = 0.0
+_random_pool_lock = threading.Lock()
+
+
+def get_user_history_products(session, user_id, limit=2):
+    """Fetch the products the user interacted with most recently"""
+    df = execute_statement(session, "get_user_history_products", [int(user_id), int(limit)], to_pandas=True)
+    return apply_product_schema(df)
+
+
+def get_random_pool(session=None):
+    """
+    Returns the shared pool of random products, resampling it when it is older than
+    RANDOM_POOL_REFRESH_INTERVAL. If resampling fails the previous pool keeps being served.
+
+    Args:
+        session: Snowpark session to resample with; one is checked out of the pool only
+            if resampling is due and none is given.
+
+    Returns:
+        pd.DataFrame: Up to RANDOM_POOL_SIZE products typed according to PRODUCT_SCHEMA.
+    """
+    global _random_pool, _random_pool_loaded_at
+
+    with _random_pool_lock:
+        if _random_pool is not None and time.monotonic() - _random_pool_loaded_at < RANDOM_POOL_REFRESH_INTERVAL:
+            return _random_pool
+        try:
+            if session is None:
+                with get_session() as session:
+                    _random_pool = sample_random_pool(session)
+            else:
+                _random_pool = sample_random_pool(session)
+            remember_products(_random_pool)
+            logger.info(f"Sampled {len(_random_pool)} products into the random pool")
+        except Exception as e:
+            if _random_pool is None:
+                raise
+            logger.error(f"Error refreshing random product pool: {str(e)}")
+        _random_pool_loaded_at = time.monotonic()
+        return _random_pool
+
+
+def sample_random_pool(session):
+    query = f"""
+    SELECT *
+    FROM PRODUCT_TABLE SAMPLE ({RANDOM_POOL_SIZE} ROWS)
+    """
+    return apply_product_schema(run_query(session.sql(query), to_pandas=True))
+
+
+def get_random_products(session=None, limit=8):
+    """Fetch random products to fill the remainder, drawn from the shared random pool"""
+    pool = get_random_pool(session)
+    positions = random.sample(range(len(pool)), min(max(limit, 0), len(pool)))
+    return pool.iloc[positions].reset_index(drop=True)
+
+
+# Each user's home feed starts with HOME_FEED_HISTORY products they recently interacted
+# with and is filled up to HOME_FEED_SIZE from the random pool. The history part is kept
+# in memory per user: it is loaded once (in the background right after login, see
+# warm_home_feed) and then updated in place from logged interactions, using the product
+# rows the engine has already served, so later feeds need no SQL at all.
+HOME_FEED_SIZE = 10
+HOME_FEED_HISTORY = 2
+HOME_FEED_CACHE_SIZE = 10000
+HOME_FEED_CACHE_TTL = 24 * 3600
+
+_home_feed_history = TTLCache(max_size=HOME_FEED_CACHE_SIZE, ttl=HOME_FEED_CACHE_TTL)
+_product_rows = TTLCache(max_size=50000, ttl=HOME_FEED_CACHE_TTL)
+_home_feed_loads = {}
+_home_feed_lock = threading.Lock()
+_home_feed_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="home-feed")
+
+
+def remember_products(df):
+    """
+    Records product rows served to users, so interactions with them can update home feeds
+    without looking the product up again.
+    """
+    for row in df.to_dict("records"):
+        _product_rows.set(row["PRODUCT_ID"], row)
+
+
+def load_home_feed_history(user_id, session=None):
+    """
+    Loads the user's recent products from the warehouse into the feed cache.
+
+    Args:
+        user_id (int): ID of the user.
+        session: Snowpark session to use; one is checked out of the pool if omitted.
+
+    Returns:
+        list: Product rows, most recent first.
+    """
+    if session is None:
+        with get_session() as session:
+            return load_home_feed_history(user_id, session)
+
+    history = get_user_history_products(session, user_id, HOME_FEED_HISTORY)
+    remember_products(history)
+    rows = history.to_dict("records")
+    _home_feed_history.set(user_id, rows)
+    return rows
+
+
+def warm_home_feed(user_id):
+    """
+    Starts loading the user's feed in the background, e.g. right after login, so it is in
+    memory by the time the home page renders.
+    """
+    with _home_feed_lock:
+        if _home_feed_history.get(user_id) is not None or user_id in _home_feed_loads:
+            return
+        future = _home_feed_executor.submit(load_home_feed_history, user_id)
+        _home_feed_loads[user_id] = future
+
+    def done(_):
+        with _home_feed_lock:
+            _home_feed_loads.pop(user_id, None)
+
+    future.add_done_callback(done)
+
+
+def note_home_feed_interaction(user_id, product_id):
+    """
+    Moves a product the user just interacted with to the front of their cached feed
+    history. If the product row is unknown the cached history is dropped and reloaded on
+    the next feed request.
+    """
+    history = _home_feed_history.get(user_id)
+    if history is None:
+        return
+    row = _product_rows.get(product_id)
+    if row is None:
+        _home_feed_history.pop(user_id)
+        return
+    rows = [row] + [r for r in history if r["PRODUCT_ID"] != product_id]
+    _home_feed_history.set(user_id, rows[:HOME_FEED_HISTORY])
+
+
+def get_home_feed(user_id, session=None, size=HOME_FEED_SIZE):
+    """
+    Returns the user's home feed: their most recent products followed by random ones.
+
+    Served from memory when the user's history is cached; otherwise waits for a pending
+    warm_home_feed load or loads it itself.
+
+    Args:
+        user_id (int): ID of the user.
+        session: Snowpark session for the queries that are still needed. If omitted, one
+            is checked out of the pool only for them, so waiting for a pending load never
+            holds a session the load itself may need.
+
+    Returns:
+        pd.DataFrame: Products typed according to PRODUCT_SCHEMA.
+    """
+    history = _home_feed_history.get(user_id)
+    if history is None:
+        with _home_feed_lock:
+            pending = _home_feed_loads.get(user_id)
+        try:
+            history = pending.result() if pending is not None else None
+        except Exception as e:
+            logger.error(f"Error preloading home feed: {str(e)}")
+        if history is None:
+            history = load_home_feed_history(user_id, session)
+
+    # Draw enough to replace random products that are already in the history
+    ids = {row["PRODUCT_ID"] for row in history}
+    random_products = get_random_products(session, size)
+    random_products = random_products[~random_products["PRODUCT_ID"].isin(ids)].head(size - len(history))
+    return apply_product_schema(
+        pd.concat([pd.DataFrame(history), random_products], ignore_index=True)
+    )
@@ -0,0 +1,76 @@
+"""
+Engine configuration, read from the environment when mindmart is first imported.
+
+Importing the package never connects to Snowflake; the session pool in
+mindmart.connection is created on first use.
+"""
+
+import os
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+SNOWFLAKE_CONFIG = {
+    "account": os.environ.get("SNOWFLAKE_ACCOUNT"),
+    "user": os.environ.get("SNOWFLAKE_USER"),
+    "password": os.environ.get("SNOWFLAKE_PASSWORD"),
+    "warehouse": os.environ.get("SNOWFLAKE_WAREHOUSE", "ECOMMERCE_WH"),
+    "database": os.environ.get("SNOWFLAKE_DATABASE", "ECOMMERCE_DB"),
+    "schema": os.environ.get("SNOWFLAKE_SCHEMA", "PUBLIC"),
+}
+if os.environ.get("SNOWFLAKE_ROLE"):
+    SNOWFLAKE_CONFIG["role"] = os.environ["SNOWFLAKE_ROLE"]
+
+# Warehouse that refreshes the Cortex Search service.
+SEARCH_WAREHOUSE = os.environ.get("MINDMART_SEARCH_WAREHOUSE", SNOWFLAKE_CONFIG["warehouse"])
+
+# Snowpark sessions are pooled and shared by all callers in the process. Each Streamlit
+# script run or batch job checks one out, so concurrent users get their own connection.
+SESSION_POOL_SIZE = env_int("MINDMART_SESSION_POOL_SIZE", 4)
+SESSION_POOL_TIMEOUT = env_int("MINDMART_SESSION_POOL_TIMEOUT", 30)
+SESSION_HEALTH_CHECK_INTERVAL = 300
+
+# Local, process-independent caches (query rewrites etc.) live here.
+CACHE_DIR = os.environ.get(
+    "MINDMART_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"),
+)
+
+# Resized product images are cached on disk up to THUMBNAIL_CACHE_MB. If THUMBNAIL_PORT
+# is set they are served from that port with long-lived cache headers (at THUMBNAIL_URL
+# as seen by browsers); otherwise they are served by Streamlit's media file manager.
+THUMBNAIL_CACHE_MB = env_int("MINDMART_THUMBNAIL_CACHE_MB", 256)
+THUMBNAIL_PORT = env_int("MINDMART_THUMBNAIL_PORT", 0)
+THUMBNAIL_URL = os.environ.get("MINDMART_THUMBNAIL_URL", f"http://localhost:{THUMBNAIL_PORT}").rstrip("/")
+
+# Level of the mindmart loggers (stage spans are logged at DEBUG, traces at INFO), and
+# whether the app shows the search trace panel in its sidebar.
+LOG_LEVEL = os.environ.get("MINDMART_LOG_LEVEL", "INFO").upper()
+ADMIN_PANEL = os.environ.get("MINDMART_ADMIN_PANEL", "").lower() in ("1", "true", "yes")
+
+# Products shown per page of the product grid (a multiple of the grid's 3 columns).
+GRID_PAGE_SIZE = env_int("MINDMART_GRID_PAGE_SIZE", 9)
+
+# Number of first-pass Cortex Search hits that are re-ranked against the user's context,
+# and how many of them are kept for the final search.
+SEARCH_CANDIDATES = 200
+RERANK_TOP_K = 100
+
+# Where first-pass candidates are re-ranked: "local" scores them against the in-process
+# ProductVectorIndex, "warehouse" runs perform_semantic_search in SQL.
+RERANK_BACKEND = os.environ.get("MINDMART_RERANK_BACKEND", "local")
+
+# "exact" scans every vector; "ivf" clusters them so catalog-wide queries only scan the
+# closest lists (useful for catalogs with millions of products).
+VECTOR_INDEX_MODE = os.environ.get("MINDMART_VECTOR_INDEX", "exact")
+
+# "procedure" runs search, re-rank and final search inside RECOMMEND_PRODUCTS in a single
+# round trip; "staged" drives the stages from the client (see run_recommendation_pipeline).
+PIPELINE_MODE = os.environ.get("MINDMART_PIPELINE_MODE", "procedure")
+
+# Threads shared by all pipeline runs for executing independent stages concurrently.
+# Stages of one run share its Snowpark session, which accepts concurrent queries.
+PIPELINE_WORKERS = env_int("MINDMART_PIPELINE_WORKERS", 8)
@@ -0,0 +1,143 @@
+"""Snowpark session pool, created lazily on first use."""
+
+import logging
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from snowflake.snowpark import Session
+
+from .config import (
+    SESSION_HEALTH_CHECK_INTERVAL,
+    SESSION_POOL_SIZE,
+    SESSION_POOL_TIMEOUT,
+    SNOWFLAKE_CONFIG,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPool:
+    """
+    Bounded pool of Snowpark sessions.
+
+    Sessions are created lazily up to size. A session idle for longer than
+    health_check_interval is pinged before reuse and replaced if the ping fails (e.g.
+    after the server expired it), as is a session that fails the ping after its user
+    raised an error or one of its queries failed (see report_query_error).
+    """
+
+    def __init__(self, config, size=SESSION_POOL_SIZE, timeout=SESSION_POOL_TIMEOUT,
+                 health_check_interval=SESSION_HEALTH_CHECK_INTERVAL):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _create(self):
+        return Session.builder.configs(self.config).create()
+
+    @staticmethod
+    def _is_healthy(session):
+        try:
+            session.sql("SELECT 1").collect()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.close()
+        except Exception as e:
+            logger.error(f"Error closing Snowpark session: {str(e)}")
+
+    def _acquire(self):
+        while True:
+            try:
+                session, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self._create()
+            if time.monotonic() - released_at < self.health_check_interval or self._is_healthy(session):
+                return session
+            logger.warning("Replacing expired Snowpark session")
+            self._close(session)
+
+    @contextmanager
+    def checkout(self):
+        """
+        Yields a session for exclusive use, blocking up to timeout seconds when all
+        size sessions are checked out.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No Snowflake session available after {self.timeout}s")
+        session = None
+        failed = False
+        try:
+            session = self._acquire()
+            yield session
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # The failure, raised to here or logged and swallowed by the engine code, may
+            # have been the connection itself
+            if session is not None and (_clear_query_error(session) or failed) \
+                    and not self._is_healthy(session):
+                logger.warning("Replacing Snowpark session after a failed query")
+                self._close(session)
+                session = None
+            if session is not None:
+                self._idle.put((session, time.monotonic()))
+            self._slots.release()
+
+
+_failed_sessions = weakref.WeakSet()
+_failed_sessions_lock = threading.Lock()
+
+
+def report_query_error(session):
+    """
+    Marks session as having had a query fail, so that the pool pings it when it is
+    checked back in even if the error never reached the with block.
+    """
+    with _failed_sessions_lock:
+        _failed_sessions.add(session)
+
+
+def _clear_query_error(session):
+    with _failed_sessions_lock:
+        failed = session in _failed_sessions
+        _failed_sessions.discard(session)
+    return failed
+
+
+_session_pool = None
+_session_pool_lock = threading.Lock()
+
+
+def get_session_pool():
+    """
+    Returns the process-wide session pool, creating it on first call. No connection is
+    opened until a session is checked out.
+    """
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = SessionPool(SNOWFLAKE_CONFIG)
+        return _session_pool
+
+
+def get_session():
+    """
+    Checks a session out of the shared pool for use in a with block, e.g. from a batch
+    job:
+
+        with get_session() as session:
+            df = get_recommendations(session, "running shoes", user_id)
+    """
+    return get_session_pool().checkout()
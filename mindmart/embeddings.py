@@ -0,0 +1,131 @@
+"""Materialized product title embeddings."""
+
+import logging
+import threading
+import time
+
+from .tracing import run_query
+
+logger = logging.getLogger(__name__)
+
+
+# Product title embeddings are computed once per (product, title) and stored in
+# PRODUCT_EMBEDDINGS. Bump PRODUCT_EMBEDDING_VERSION to force a full re-embed.
+PRODUCT_EMBEDDING_MODEL = "snowflake-arctic-embed-m"
+PRODUCT_EMBEDDING_VERSION = 1
+
+# How often (seconds) a process embeds new or changed catalog products.
+PRODUCT_EMBEDDINGS_REFRESH_INTERVAL = 600
+
+_product_embeddings_refreshed_at = None
+_product_embeddings_lock = threading.Lock()
+_product_embeddings_table_ready = False
+
+
+def ensure_product_embeddings_table(session):
+    """
+    Creates PRODUCT_EMBEDDINGS on first use in this process. Every query that reads the
+    table calls this first, since the table is filled by background upkeep that may not
+    have run yet.
+    """
+    global _product_embeddings_table_ready
+
+    if _product_embeddings_table_ready:
+        return
+    session.sql("""
+        CREATE TABLE IF NOT EXISTS PRODUCT_EMBEDDINGS (
+            PRODUCT_ID NUMBER,
+            TITLE_HASH VARCHAR(64),
+            EMBEDDING_MODEL VARCHAR,
+            EMBEDDING_VERSION NUMBER,
+            PRODUCT_VEC VECTOR(FLOAT, 768),
+            EMBEDDED_AT TIMESTAMP_NTZ
+        )
+    """).collect()
+    _product_embeddings_table_ready = True
+
+
+def embedding_join_sql(alias):
+    """
+    Returns the LEFT JOIN clause attaching the stored embedding (alias "e") to a
+    product row source. Rows whose title changed since they were embedded do not match.
+    """
+    return f"""
+        LEFT JOIN PRODUCT_EMBEDDINGS e
+            ON e.PRODUCT_ID = {alias}.PRODUCT_ID
+            AND e.TITLE_HASH = SHA2({alias}.TITLE, 256)
+            AND e.EMBEDDING_MODEL = '{PRODUCT_EMBEDDING_MODEL}'
+            AND e.EMBEDDING_VERSION = {PRODUCT_EMBEDDING_VERSION}
+    """
+
+
+def embedding_column_sql(alias):
+    """
+    Returns the expression selecting a product's vector from the embedding join, embedding
+    the title on the fly only for products not yet in PRODUCT_EMBEDDINGS.
+    """
+    return (
+        f"COALESCE(e.PRODUCT_VEC, "
+        f"SNOWFLAKE.CORTEX.EMBED_TEXT_768('{PRODUCT_EMBEDDING_MODEL}', {alias}.TITLE))"
+    )
+
+
+def refresh_product_embeddings(session, force=False):
+    """
+    Embeds new or changed catalog products into PRODUCT_EMBEDDINGS in one bulk MERGE.
+
+    Only products without a row for the current model/version, or whose TITLE hash
+    differs from the stored one, are sent to EMBED_TEXT_768. The refresh runs at most
+    once every PRODUCT_EMBEDDINGS_REFRESH_INTERVAL seconds per process.
+
+    Args:
+        session: Snowpark session object
+        force (bool): Refresh even if the interval has not elapsed.
+
+    Returns:
+        bool: True if the refresh ran, False if it was skipped.
+    """
+    global _product_embeddings_refreshed_at
+
+    with _product_embeddings_lock:
+        if (
+            not force
+            and _product_embeddings_refreshed_at is not None
+            and time.monotonic() - _product_embeddings_refreshed_at < PRODUCT_EMBEDDINGS_REFRESH_INTERVAL
+        ):
+            return False
+
+        ensure_product_embeddings_table(session)
+
+        result = run_query(session.sql(f"""
+            MERGE INTO PRODUCT_EMBEDDINGS t
+            USING (
+                SELECT
+                    p.PRODUCT_ID,
+                    SHA2(p.TITLE, 256) AS TITLE_HASH,
+                    SNOWFLAKE.CORTEX.EMBED_TEXT_768('{PRODUCT_EMBEDDING_MODEL}', p.TITLE) AS PRODUCT_VEC
+                FROM PRODUCT_TABLE p
+                LEFT JOIN PRODUCT_EMBEDDINGS cur
+                    ON cur.PRODUCT_ID = p.PRODUCT_ID
+                    AND cur.EMBEDDING_MODEL = '{PRODUCT_EMBEDDING_MODEL}'
+                    AND cur.EMBEDDING_VERSION = {PRODUCT_EMBEDDING_VERSION}
+                WHERE p.TITLE IS NOT NULL
+                AND (cur.PRODUCT_ID IS NULL OR cur.TITLE_HASH != SHA2(p.TITLE, 256))
+            ) s
+            ON t.PRODUCT_ID = s.PRODUCT_ID
+            AND t.EMBEDDING_MODEL = '{PRODUCT_EMBEDDING_MODEL}'
+            AND t.EMBEDDING_VERSION = {PRODUCT_EMBEDDING_VERSION}
+            WHEN MATCHED THEN UPDATE SET
+                TITLE_HASH = s.TITLE_HASH,
+                PRODUCT_VEC = s.PRODUCT_VEC,
+                EMBEDDED_AT = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN INSERT
+                (PRODUCT_ID, TITLE_HASH, EMBEDDING_MODEL, EMBEDDING_VERSION, PRODUCT_VEC, EMBEDDED_AT)
+            VALUES
+                (s.PRODUCT_ID, s.TITLE_HASH, '{PRODUCT_EMBEDDING_MODEL}', {PRODUCT_EMBEDDING_VERSION},
+                 s.PRODUCT_VEC, CURRENT_TIMESTAMP())
+        """))
+
+        logger.info(f"Product embeddings refreshed: {result[0].as_dict() if result else {}}")
+        _product_embeddings_refreshed_at = time.monotonic()
+        return True
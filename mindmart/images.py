@@ -0,0 +1,250 @@
+"""Local cache of resized product images."""
+
+import glob
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from .cache import TTLCache
+from .config import CACHE_DIR, THUMBNAIL_CACHE_MB, THUMBNAIL_PORT, THUMBNAIL_URL
+
+logger = logging.getLogger(__name__)
+
+# Product images are fetched from their origin once, resized to every THUMBNAIL_SIZES
+# width and kept as JPEGs in THUMBNAIL_DIR, which is trimmed to THUMBNAIL_CACHE_MB by
+# evicting the least recently used files. Images that cannot be fetched are replaced by
+# a locally generated placeholder and not retried for THUMBNAIL_RETRY_INTERVAL seconds.
+THUMBNAIL_SIZES = (200, 400)
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, "thumbnails")
+THUMBNAIL_FETCH_TIMEOUT = 5
+THUMBNAIL_RETRY_INTERVAL = 600
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_WORKERS = 8
+
+THUMBNAIL_FILE_PATTERN = re.compile(r"^[0-9a-f]{32}-\d+\.jpg$")
+
+
+class ThumbnailCache:
+    """
+    Size-bounded on-disk LRU cache of resized images. Hits refresh the file's modification
+    time, which eviction uses as the recency order.
+    """
+
+    def __init__(self, directory=THUMBNAIL_DIR, max_bytes=THUMBNAIL_CACHE_MB * 1024 * 1024,
+                 sizes=THUMBNAIL_SIZES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sizes = sizes
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+        self._failures = TTLCache(max_size=10000, ttl=THUMBNAIL_RETRY_INTERVAL)
+        self._placeholders = {}
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(
+            os.path.getsize(path) for path in glob.glob(os.path.join(directory, "*.jpg"))
+        )
+
+    @staticmethod
+    def file_name(url, size):
+        return f"{hashlib.sha256(url.encode()).hexdigest()[:32]}-{size}.jpg"
+
+    def path(self, url, size):
+        return os.path.join(self.directory, self.file_name(url, size))
+
+    def placeholder(self, size):
+        """
+        Returns a plain grey JPEG of size x size pixels.
+        """
+        if size not in self._placeholders:
+            buffer = io.BytesIO()
+            Image.new("RGB", (size, size), (230, 230, 230)).save(buffer, "JPEG")
+            self._placeholders[size] = buffer.getvalue()
+        return self._placeholders[size]
+
+    def get(self, url, size, fetch=True):
+        """
+        Returns the path of the cached size-wide thumbnail of url, fetching and resizing
+        the image on a miss, or None if the image could not be fetched (or is not cached
+        and fetch is off).
+        """
+        if not isinstance(url, str) or not url:
+            return None
+        path = self.path(url, size)
+        if self._touch(path):
+            return path
+        if not fetch or self._failures.get(url):
+            return None
+
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(url, threading.Lock())
+        with fetch_lock:
+            # Another thread may have fetched it while this one waited
+            if not self._touch(path):
+                try:
+                    self._fetch(url)
+                except Exception as e:
+                    logger.error(f"Error fetching image {url}: {str(e)}")
+                    self._failures.set(url, True)
+        with self._lock:
+            self._fetch_locks.pop(url, None)
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def _fetch(self, url):
+        request = urllib.request.Request(url, headers={"User-Agent": "MindMart thumbnailer"})
+        with urllib.request.urlopen(request, timeout=THUMBNAIL_FETCH_TIMEOUT) as response:
+            original = Image.open(io.BytesIO(response.read())).convert("RGB")
+
+        written = 0
+        for size in self.sizes:
+            image = original.copy()
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+            path = self.path(url, size)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(f"{path}.tmp", path)
+            written += buffer.tell()
+
+        with self._lock:
+            self._total_bytes += written
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Caller holds self._lock. Trims to 90% of max_bytes so eviction is not rerun on
+        # every new image.
+        files = []
+        for path in glob.glob(os.path.join(self.directory, "*.jpg")):
+            try:
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                pass
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+
+class ThumbnailRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves cached thumbnails by file name with long-lived cache headers. Only files the
+    app has already generated are served; the handler never fetches anything itself.
+    """
+
+    def is_thumbnail_request(self):
+        name = self.path.lstrip("/").split("?", 1)[0]
+        if THUMBNAIL_FILE_PATTERN.match(name):
+            return True
+        self.send_error(404)
+        return False
+
+    def do_GET(self):
+        if self.is_thumbnail_request():
+            super().do_GET()
+
+    def do_HEAD(self):
+        if self.is_thumbnail_request():
+            super().do_HEAD()
+
+    def send_response(self, code, message=None):
+        self.status_code = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        # Only thumbnails are immutable; a 404 may be served before one is generated
+        if self.status_code == 200:
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+_thumbnail_cache = None
+_thumbnail_server = None
+_thumbnail_lock = threading.Lock()
+_thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+
+
+def get_thumbnail_cache():
+    """
+    Returns the process-wide ThumbnailCache, starting the thumbnail HTTP server on
+    THUMBNAIL_PORT the first time if one is configured.
+    """
+    global _thumbnail_cache, _thumbnail_server
+
+    with _thumbnail_lock:
+        if _thumbnail_cache is None:
+            _thumbnail_cache = ThumbnailCache()
+            if THUMBNAIL_PORT:
+                try:
+                    handler = partial(ThumbnailRequestHandler, directory=_thumbnail_cache.directory)
+                    _thumbnail_server = ThreadingHTTPServer(("", THUMBNAIL_PORT), handler)
+                    threading.Thread(
+                        target=_thumbnail_server.serve_forever, name="thumbnail-server", daemon=True
+                    ).start()
+                except OSError as e:
+                    # Usually another app process on the host already serves the directory
+                    logger.warning(f"Thumbnail server not started on port {THUMBNAIL_PORT}: {str(e)}")
+        return _thumbnail_cache
+
+
+def prefetch_thumbnails(urls, size, wait=True):
+    """
+    Fetches the thumbnails of several images concurrently, e.g. for a grid of products
+    about to be rendered.
+
+    Args:
+        urls (iterable): Image URLs.
+        size (int): Thumbnail width.
+        wait (bool): Block until all are fetched; otherwise fetch in the background, e.g.
+            for the next page of a grid.
+    """
+    cache = get_thumbnail_cache()
+    futures = [_thumbnail_executor.submit(cache.get, url, size) for url in set(urls)]
+    if wait:
+        for future in futures:
+            future.result()
+
+
+def thumbnail_src(url, size, fetch=True):
+    """
+    Returns the image to pass to st.image for the size-wide thumbnail of url: a link to
+    the thumbnail server when one is configured, otherwise the path of the cached file,
+    which Streamlit's media file manager serves under a URL derived from its content, so
+    reruns send the browser the same URL instead of the image. Falls back to the JPEG
+    bytes of the local placeholder when the image is unavailable, or not cached yet and
+    fetch is off.
+    """
+    cache = get_thumbnail_cache()
+    path = cache.get(url, size, fetch=fetch)
+    if path is None:
+        return cache.placeholder(size)
+    if THUMBNAIL_PORT:
+        return f"{THUMBNAIL_URL}/{cache.file_name(url, size)}"
+    return path
@@ -0,0 +1,383 @@
+"""Recording of user interactions with products."""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from .catalog import note_home_feed_interaction
+from .config import CACHE_DIR
+from .connection import get_session
+from .pipeline import bump_profile_version
+from .profiles import update_user_profiles
+
+logger = logging.getLogger(__name__)
+
+INTERACTION_TABLE = "ECOMMERCE_DB.PUBLIC.USER_INTERACTION_TABLE"
+
+# Clicks are appended to a local spool before anything else, so they survive warehouse
+# outages and restarts. A background thread replays the spool in bulk as soon as
+# INTERACTION_BATCH_SIZE interactions are waiting or INTERACTION_FLUSH_INTERVAL seconds
+# after the oldest one arrived.
+INTERACTION_BATCH_SIZE = 500
+INTERACTION_FLUSH_INTERVAL = 2
+
+# Seconds to wait before retrying after a replay failed, e.g. during a warehouse outage.
+INTERACTION_RETRY_INTERVAL = 5
+
+# The spool is a directory of append-only JSON-lines segments. The segment being written
+# ends in .open; it is sealed (renamed to .jsonl) before replay, and a replayer claims a
+# sealed segment by renaming it to .replay, refreshing its modification time. Segments
+# left .open or .replay for longer than SPOOL_ORPHAN_AGE seconds belong to a process that
+# died and are replayed again; every interaction carries an EVENT_ID, so replaying a
+# segment again never duplicates rows.
+SPOOL_DIR = os.path.join(CACHE_DIR, "interactions")
+SPOOL_SEGMENT_BYTES = 4 * 1024 * 1024
+SPOOL_ORPHAN_AGE = 600
+
+# Snowflake type and pandas dtype of every column of an interaction batch, in the order
+# interactions are spooled and uploaded.
+INTERACTION_SCHEMA = {
+    "EVENT_ID": ("VARCHAR(32)", "string"),
+    "USER_ID": ("NUMBER", "int64"),
+    "PRODUCT_ID": ("NUMBER", "int64"),
+    "INTERACTION_TYPE": ("VARCHAR", "string"),
+    "INTERACTION_TIMESTAMP": ("TIMESTAMP_NTZ", "datetime64[ns]"),
+}
+INTERACTION_COLUMNS = list(INTERACTION_SCHEMA)
+
+_event_id_column_ready = False
+
+
+def ensure_interaction_event_ids(session):
+    """
+    Adds the EVENT_ID column used to deduplicate replayed interactions, once per process.
+    """
+    global _event_id_column_ready
+
+    if _event_id_column_ready:
+        return
+    session.sql(f"ALTER TABLE {INTERACTION_TABLE} ADD COLUMN IF NOT EXISTS EVENT_ID VARCHAR(32)").collect()
+    _event_id_column_ready = True
+
+
+def interaction_frame(rows):
+    """
+    Returns a batch of interactions as a DataFrame typed according to INTERACTION_SCHEMA.
+
+    Args:
+        rows (list): Rows in INTERACTION_COLUMNS order; timestamps may be strings.
+    """
+    df = pd.DataFrame(rows, columns=INTERACTION_COLUMNS)
+    df["INTERACTION_TIMESTAMP"] = pd.to_datetime(df["INTERACTION_TIMESTAMP"])
+    return df.astype({column: dtype for column, (_, dtype) in INTERACTION_SCHEMA.items()})
+
+
+def write_interactions(session, rows):
+    """
+    Writes a batch of interactions to USER_INTERACTION_TABLE and folds them into the
+    users' profile vectors. Interactions whose EVENT_ID is already in the table are
+    skipped, so a batch can safely be written more than once.
+
+    The batch is uploaded once with write_pandas into a temporary table typed according
+    to INTERACTION_SCHEMA, from which the deduplication, the insert and the profile
+    update read, so the warehouse sees a few set-based statements regardless of the
+    batch size.
+
+    Args:
+        session: Snowpark session.
+        rows (list): (EVENT_ID, USER_ID, PRODUCT_ID, INTERACTION_TYPE, INTERACTION_TIMESTAMP)
+            tuples.
+    """
+    ensure_interaction_event_ids(session)
+    batch_table = f"INTERACTION_BATCH_{uuid.uuid4().hex[:12]}".upper()
+    columns = ", ".join(f"{column} {sql_type}" for column, (sql_type, _) in INTERACTION_SCHEMA.items())
+    session.sql(f"CREATE OR REPLACE TEMPORARY TABLE {batch_table} ({columns})").collect()
+    try:
+        session.write_pandas(
+            interaction_frame(rows),
+            batch_table,
+            overwrite=False,
+            quote_identifiers=False,
+            use_logical_type=True,
+        )
+
+        # Earlier replays of this batch can only have written rows at or after its oldest
+        # timestamp, which keeps the lookup to recent micro-partitions.
+        session.sql(f"""
+            DELETE FROM {batch_table} b
+            USING (
+                SELECT EVENT_ID
+                FROM {INTERACTION_TABLE}
+                WHERE INTERACTION_TIMESTAMP >= (
+                    SELECT MIN(INTERACTION_TIMESTAMP) FROM {batch_table}
+                )
+            ) i
+            WHERE i.EVENT_ID = b.EVENT_ID
+        """).collect()
+
+        events_sql = f"""
+            SELECT EVENT_ID, USER_ID, PRODUCT_ID, INTERACTION_TYPE, INTERACTION_TIMESTAMP
+            FROM {batch_table}
+        """
+        session.sql(f"""
+            INSERT INTO {INTERACTION_TABLE}
+            (EVENT_ID, USER_ID, PRODUCT_ID, INTERACTION_TYPE, INTERACTION_TIMESTAMP)
+            {events_sql}
+        """).collect()
+
+        # The interactions themselves are recorded, so a failure here only delays
+        # personalization until the next batch.
+        try:
+            update_user_profiles(session, events_sql)
+        except Exception as e:
+            logger.error(f"Error updating user profiles: {str(e)}")
+    finally:
+        session.sql(f"DROP TABLE IF EXISTS {batch_table}").collect()
+
+
+def read_segment(path):
+    """
+    Reads the interactions of a spool segment. A torn last line (from a crash mid-write)
+    is skipped.
+
+    Returns:
+        list: Rows in INTERACTION_COLUMNS order.
+    """
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                rows.append(tuple(record[column] for column in INTERACTION_COLUMNS))
+            except (ValueError, KeyError):
+                logger.warning(f"Skipping unreadable interaction in {path}")
+    return rows
+
+
+class InteractionSpool:
+    """
+    Durable local write-ahead spool of interactions, replayed to the warehouse in bulk on a
+    background thread.
+
+    append only touches the local disk, so clicks never wait for Snowflake. The thread is
+    started on the first append, so creating the spool opens no connection. Once running
+    it also replays segments left by a failed replay or by dead processes, without
+    waiting for another append.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, batch_size=INTERACTION_BATCH_SIZE,
+                 flush_interval=INTERACTION_FLUSH_INTERVAL, retry_interval=INTERACTION_RETRY_INTERVAL,
+                 segment_bytes=SPOOL_SEGMENT_BYTES, orphan_age=SPOOL_ORPHAN_AGE):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.segment_bytes = segment_bytes
+        self.orphan_age = orphan_age
+        self._file = None
+        self._path = None
+        self._sequence = 0
+        self._count = 0
+        self._oldest = None
+        self._retry_at = 0.0
+        self._condition = threading.Condition()
+        self._replay_lock = threading.Lock()
+        self._thread = None
+
+    def append(self, record):
+        """
+        Appends one interaction (a dict with INTERACTION_COLUMNS keys) and syncs it to disk.
+        """
+        line = json.dumps(record) + "\n"
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="interaction-replayer", daemon=True)
+                self._thread.start()
+            if self._file is None:
+                self._open_segment()
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if not self._count:
+                self._oldest = time.monotonic()
+            self._count += 1
+            if self._count >= self.batch_size or self._file.tell() >= self.segment_bytes:
+                self._condition.notify()
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = f"{time.time_ns()}-{os.getpid()}-{self._sequence:06d}"
+        self._path = os.path.join(self.directory, name)
+        self._file = open(f"{self._path}.open", "a", encoding="utf-8")
+
+    def _seal(self):
+        # Caller holds self._condition
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(f"{self._path}.open", f"{self._path}.jsonl")
+        self._file = None
+        self._count = 0
+        self._oldest = None
+
+    def _orphans(self):
+        cutoff = time.time() - self.orphan_age
+        for path in glob.glob(os.path.join(self.directory, "*.open")) + \
+                glob.glob(os.path.join(self.directory, "*.replay")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    yield path
+            except OSError:
+                pass
+
+    def _recover_orphans(self):
+        for path in self._orphans():
+            logger.warning(f"Recovering orphaned interaction segment {path}")
+            try:
+                os.replace(path, path.rsplit(".", 1)[0] + ".jsonl")
+            except OSError:
+                pass
+
+    def _has_backlog(self):
+        """
+        Returns whether sealed or orphaned segments are waiting to be replayed.
+        """
+        return bool(glob.glob(os.path.join(self.directory, "*.jsonl"))) or any(self._orphans())
+
+    def _due(self, backlog):
+        # Caller holds self._condition
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        if self._count >= self.batch_size:
+            return True
+        if self._count and now - self._oldest >= self.flush_interval:
+            return True
+        return backlog
+
+    def _run(self):
+        while True:
+            try:
+                # The backlog is checked at least every flush_interval seconds, so
+                # segments left behind are replayed even if nothing is appended
+                while True:
+                    backlog = self._has_backlog()
+                    with self._condition:
+                        if self._due(backlog):
+                            break
+                        timeout = self.flush_interval
+                        if self._count:
+                            timeout = max(0, self._oldest + self.flush_interval - time.monotonic())
+                        self._condition.wait(max(timeout, self._retry_at - time.monotonic()))
+                written = self.replay()
+                if backlog and not written:
+                    # Nothing could be replayed (e.g. segments claimed by another
+                    # process); look again later instead of spinning
+                    self._retry_at = max(self._retry_at, time.monotonic() + self.flush_interval)
+            except Exception as e:
+                # Keep the thread alive whatever happens; the spool is retried later
+                logger.error(f"Error in interaction replayer: {str(e)}")
+                self._retry_at = time.monotonic() + self.retry_interval
+
+    def replay(self):
+        """
+        Seals the current segment and writes every sealed segment to the warehouse, oldest
+        first. A segment is deleted only after it was written, and stays in the spool for
+        the next replay if writing fails, which is then retried after retry_interval
+        seconds.
+
+        Returns:
+            int: Number of interactions written.
+        """
+        with self._replay_lock:
+            with self._condition:
+                self._seal()
+            if not os.path.isdir(self.directory):
+                return 0
+            self._recover_orphans()
+
+            written = 0
+            for path in sorted(glob.glob(os.path.join(self.directory, "*.jsonl"))):
+                claimed = path[:-len(".jsonl")] + ".replay"
+                try:
+                    # Renaming keeps the modification time, so refresh it first or other
+                    # processes would take an old segment for an orphan while it is replayed
+                    os.utime(path)
+                    os.replace(path, claimed)
+                    rows = read_segment(claimed)
+                except FileNotFoundError:
+                    continue  # Claimed by another process
+                if rows:
+                    try:
+                        with get_session() as session:
+                            write_interactions(session, rows)
+                    except Exception as e:
+                        logger.error(f"Error replaying {len(rows)} interactions: {str(e)}")
+                        self._retry_at = time.monotonic() + self.retry_interval
+                        try:
+                            os.replace(claimed, path)
+                        except FileNotFoundError:
+                            pass
+                        return written
+                try:
+                    os.remove(claimed)
+                except FileNotFoundError:
+                    logger.warning(f"Interaction segment {claimed} was removed during replay")
+                for user_id in {row[1] for row in rows}:
+                    bump_profile_version(user_id)
+                written += len(rows)
+            return written
+
+
+_interaction_spool = InteractionSpool()
+atexit.register(_interaction_spool.replay)
+
+
+def log_interaction(user_id, product_id, interaction_type):
+    """
+    Records a user interaction with a product. The interaction is written to the local
+    spool and replayed to the warehouse in bulk, so this returns without waiting for
+    Snowflake and nothing is lost while it is unavailable.
+
+    Args:
+        user_id (int): ID of the user.
+        product_id (int): ID of the product.
+        interaction_type (str): One of INTERACTION_WEIGHTS (view, like, add_to_cart, purchase).
+
+    Returns:
+        bool: True once the interaction is on disk, False if the spool could not be written.
+    """
+    current_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    try:
+        _interaction_spool.append({
+            "EVENT_ID": uuid.uuid4().hex,
+            "USER_ID": int(user_id),
+            "PRODUCT_ID": int(product_id),
+            "INTERACTION_TYPE": interaction_type,
+            "INTERACTION_TIMESTAMP": current_timestamp,
+        })
+    except OSError as e:
+        logger.error(f"Error spooling interaction: {str(e)}")
+        return False
+
+    note_home_feed_interaction(int(user_id), int(product_id))
+    return True
+
+
+def flush_interactions():
+    """
+    Replays the whole spool now, e.g. at the end of a batch job.
+
+    Returns:
+        int: Number of interactions written.
+    """
+    return _interaction_spool.replay()
@@ -0,0 +1,592 @@
+"""Recommendation pipeline: rewrite, search, context, re-rank and final search."""
+
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from .cache import TTLCache
+from .catalog import remember_products
+from .config import (
+    GRID_PAGE_SIZE,
+    PIPELINE_MODE,
+    PIPELINE_WORKERS,
+    RERANK_BACKEND,
+    RERANK_TOP_K,
+    SEARCH_CANDIDATES,
+)
+from .connection import get_session
+from .embeddings import (
+    PRODUCT_EMBEDDINGS_REFRESH_INTERVAL,
+    embedding_column_sql,
+    embedding_join_sql,
+    ensure_product_embeddings_table,
+    refresh_product_embeddings,
+)
+from .profiles import backfill_user_profiles, ensure_user_profile_table, get_profile_vector
+from .rewrite import get_mistral_query, normalize_query
+from .schema import SEARCH_COLUMNS, apply_product_schema, search_results_sql
+from .search import (
+    ensure_cortex_search_service,
+    filter_augment_table,
+    filter_temp_table,
+    search_candidate_ids,
+    search_products,
+)
+from .statements import execute_statement
+from .tables import cleanup_tables, pipeline_tables
+from .tracing import Trace, bind_trace, run_query, span, traced, use_trace
+from .vector_index import get_product_index
+
+logger = logging.getLogger(__name__)
+
+
+def construct_context(session, user_id, tables):
+    """
+    Builds the run's context table from the user's profile vector (see
+    update_user_profiles) and returns it as a JSON string. The table holds at most one
+    row; it is empty for users without any embedded interactions.
+
+    Args:
+        session: Snowpark session object
+        user_id: ID of the user for whom the context is being constructed
+        tables (dict): Working table names of the current run (see pipeline_tables)
+
+    Returns:
+        str: A JSON string representation of the context table
+    """
+    try:
+        ensure_user_profile_table(session)
+
+        # Step 1: Create or replace the context table from the stored profile
+        execute_statement(session, "construct_context", [tables["CONTEXT_TABLE"], int(user_id)])
+
+        # Step 2: Fetch the updated context table
+        results = execute_statement(session, "read_context", [tables["CONTEXT_TABLE"]], to_pandas=True)
+
+        # Step 3: Convert the DataFrame to JSON
+        context = results.to_json(orient="records", lines=False)
+        return context
+
+    except Exception as e:
+        raise Exception(f"Error constructing and updating context: {str(e)}")
+
+
+def perform_semantic_search(session, user_id, tables, top_k=RERANK_TOP_K, threshold=0.5):
+    """
+    Re-ranks the first-pass search results against the user's context and keeps the best
+    top_k of them in the run's AUGMENT_TABLE.
+
+    The similarity is computed once per (candidate, context vector) pair and every
+    candidate keeps its best score, so the context table may hold one aggregated profile
+    vector or several per-interaction vectors. The work is bounded by
+    SEARCH_CANDIDATES x context rows and never touches the rest of the catalog.
+
+    Args:
+        session: Snowpark session object
+        user_id: ID of the user the results are ranked for
+        tables (dict): Working table names of the current run (see pipeline_tables)
+        top_k (int): Number of candidates to keep.
+        threshold (float): Minimum cosine similarity for a candidate to be kept.
+
+    Returns:
+        None
+    """
+    try:
+        ensure_product_embeddings_table(session)
+        run_query(session.sql(f"""
+            CREATE OR REPLACE TEMPORARY TABLE {tables["AUGMENT_TABLE"]} AS
+            WITH scored AS (
+                SELECT 
+                    t.*,
+                    VECTOR_COSINE_SIMILARITY(c.context_vec, {embedding_column_sql("t")}) AS similarity
+                FROM {tables["TEMP_TABLE"]} t
+                {embedding_join_sql("t")}
+                CROSS JOIN {tables["CONTEXT_TABLE"]} c
+            )
+            SELECT *
+            FROM scored
+            WHERE similarity > {threshold}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY PRODUCT_ID ORDER BY similarity DESC) = 1
+            ORDER BY similarity DESC
+            LIMIT {int(top_k)}
+        """))
+
+        logger.debug(f"Top {top_k} results successfully stored in {tables['AUGMENT_TABLE']}.")
+    except Exception as e:
+        logger.error(f"Error during semantic search: {str(e)}")
+
+_recommendation_procedure = None
+_recommendation_procedure_lock = threading.Lock()
+
+
+def recommendation_procedure_sql(service_name):
+    """
+    Returns the DDL of RECOMMEND_PRODUCTS, the server-side version of the pipeline.
+
+    The procedure runs the first-pass Cortex search, re-ranks the hits against the
+    user's profile vector with the stored product embeddings, runs the final search
+    restricted to the top-k products (or unrestricted for users without a profile) and
+    returns its rows in search order (see search_results_sql).
+    """
+    columns = ", ".join(f"'{column}'" for column in SEARCH_COLUMNS)
+    return f"""
+        CREATE OR REPLACE PROCEDURE RECOMMEND_PRODUCTS(
+            SEARCH_QUERY VARCHAR,
+            TARGET_USER_ID NUMBER,
+            CANDIDATES NUMBER,
+            TOP_K NUMBER,
+            THRESHOLD FLOAT
+        )
+        RETURNS TABLE ()
+        LANGUAGE SQL
+        EXECUTE AS CALLER
+        AS
+        $$
+        DECLARE
+            search_columns ARRAY DEFAULT ARRAY_CONSTRUCT({columns});
+            first_pass VARCHAR;
+            final_pass VARCHAR;
+            product_filter ARRAY;
+            top_count NUMBER DEFAULT 0;
+            res RESULTSET;
+        BEGIN
+            first_pass := TO_JSON(OBJECT_CONSTRUCT(
+                'query', SEARCH_QUERY, 'columns', search_columns, 'limit', CANDIDATES
+            ));
+
+            SELECT
+                ARRAY_AGG(OBJECT_CONSTRUCT('@eq', OBJECT_CONSTRUCT('PRODUCT_ID', PRODUCT_ID))),
+                COUNT(*)
+            INTO :product_filter, :top_count
+            FROM (
+                SELECT
+                    c.PRODUCT_ID,
+                    VECTOR_COSINE_SIMILARITY(u.PROFILE_VEC, {embedding_column_sql("c")}) AS SIMILARITY
+                FROM ({search_results_sql(f"'{service_name}'", ":first_pass")}) c
+                {embedding_join_sql("c")}
+                JOIN USER_PROFILE_VECTORS u ON u.USER_ID = :TARGET_USER_ID
+                WHERE SIMILARITY > :THRESHOLD
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY c.PRODUCT_ID ORDER BY SIMILARITY DESC) = 1
+                ORDER BY SIMILARITY DESC
+                LIMIT :TOP_K
+            );
+
+            IF (top_count > 0) THEN
+                final_pass := TO_JSON(OBJECT_CONSTRUCT(
+                    'query', SEARCH_QUERY, 'columns', search_columns,
+                    'filter', OBJECT_CONSTRUCT('@or', product_filter), 'limit', top_count
+                ));
+            ELSE
+                final_pass := TO_JSON(OBJECT_CONSTRUCT(
+                    'query', SEARCH_QUERY, 'columns', search_columns, 'limit', TOP_K
+                ));
+            END IF;
+
+            res := (
+                {search_results_sql(f"'{service_name}'", ":final_pass")}
+                ORDER BY SEARCH_RANK
+            );
+            RETURN TABLE(res);
+        END;
+        $$
+    """
+
+
+def ensure_recommendation_procedure(session, service_name):
+    """
+    Creates RECOMMEND_PRODUCTS once per process (and again if its definition changes).
+    """
+    global _recommendation_procedure
+
+    ddl = recommendation_procedure_sql(service_name)
+    fingerprint = hashlib.sha256(ddl.encode()).hexdigest()
+    with _recommendation_procedure_lock:
+        if _recommendation_procedure != fingerprint:
+            ensure_user_profile_table(session)
+            ensure_product_embeddings_table(session)
+            run_query(session.sql(ddl))
+            _recommendation_procedure = fingerprint
+
+_stage_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+
+
+def run_stage_graph(stages):
+    """
+    Runs a small dependency graph of pipeline stages, starting every stage as soon as
+    the stages it depends on have finished, so latency follows the longest chain. Every
+    stage runs as a span of the caller's current trace, named after the stage.
+
+    Args:
+        stages (dict): Maps a stage name to (function, [dependency names]). The function
+            receives a dict with the results of its dependencies.
+
+    Returns:
+        dict: Result of every stage by name. The first stage error is re-raised once
+            every stage already started has finished; the others are not started.
+    """
+    results = {}
+    pending = dict(stages)
+    running = {}
+
+    while pending or running:
+        for name, (function, dependencies) in list(pending.items()):
+            if all(dependency in results for dependency in dependencies):
+                inputs = {dependency: results[dependency] for dependency in dependencies}
+                running[_stage_executor.submit(bind_trace(run_stage), name, function, inputs)] = name
+                del pending[name]
+
+        if not running:
+            raise ValueError(f"Unsatisfiable stage dependencies: {sorted(pending)}")
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception:
+                # The other stages share the caller's session, which the caller may clean
+                # up or return to the pool as soon as this raises, so none may still run
+                for other in running:
+                    other.cancel()
+                wait(running)
+                raise
+
+    return results
+
+
+def run_stage(name, function, inputs):
+    """
+    Runs one stage of run_stage_graph as a span, recording the size of its result.
+    """
+    with span(name) as item:
+        result = function(inputs)
+        item.record_result(result)
+        return result
+
+
+def rewrite_query(session, human_query):
+    """
+    Returns the cleaned-up Mistral rewrite of a search query.
+    """
+    human_query = human_query.replace('"', '').replace("'", "")
+
+    mistral_query = get_mistral_query(session, human_query)
+    mistral_query = mistral_query.replace('"', '').replace("'", "").replace("\\", "")
+
+    logger.debug("Rewritten query: %s", mistral_query)
+    return mistral_query
+
+
+def refresh_recommendation_stores(session):
+    """
+    Periodic upkeep of the embeddings, profiles and vector index (see
+    refresh_product_embeddings); a no-op between refresh intervals. The vector index is
+    only loaded by the staged pipeline with the local re-rank, the one mode that reads it.
+    """
+    with span("embeddings"):
+        refreshed = refresh_product_embeddings(session)
+    if refreshed:
+        with span("profiles"):
+            backfill_user_profiles(session)
+        if PIPELINE_MODE == "staged" and RERANK_BACKEND == "local":
+            with span("index"):
+                get_product_index(session, refresh=True)
+
+
+# Store upkeep runs on its own thread with its own pooled session, so no search waits for
+# new products to be embedded; searches use the embeddings that already exist (missing
+# ones are embedded on the fly, see embedding_column_sql). A failed upkeep is logged and
+# retried after STORE_UPKEEP_RETRY_INTERVAL seconds instead of on every search.
+STORE_UPKEEP_RETRY_INTERVAL = 60
+
+_store_upkeep = None
+_store_upkeep_due_at = 0.0
+_store_upkeep_lock = threading.Lock()
+_store_upkeep_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-upkeep")
+
+
+def run_store_upkeep():
+    """
+    Runs refresh_recommendation_stores with a pooled session as an "upkeep" trace and
+    schedules the next run. Errors are logged, never raised.
+    """
+    global _store_upkeep_due_at
+
+    try:
+        with traced("upkeep"), get_session() as session:
+            refresh_recommendation_stores(session)
+        delay = PRODUCT_EMBEDDINGS_REFRESH_INTERVAL
+    except Exception as e:
+        logger.error(f"Error refreshing recommendation stores: {str(e)}")
+        delay = STORE_UPKEEP_RETRY_INTERVAL
+    with _store_upkeep_lock:
+        _store_upkeep_due_at = time.monotonic() + delay
+
+
+def schedule_store_upkeep():
+    """
+    Starts run_store_upkeep in the background when it is due and not already running.
+    Returns immediately.
+    """
+    global _store_upkeep
+
+    with _store_upkeep_lock:
+        if time.monotonic() < _store_upkeep_due_at or (_store_upkeep is not None and not _store_upkeep.done()):
+            return
+        _store_upkeep = _store_upkeep_executor.submit(run_store_upkeep)
+
+
+def call_recommendation_procedure(session, mistral_query, user_id):
+    """
+    Calls RECOMMEND_PRODUCTS and returns its rows.
+    """
+    try:
+        df = execute_statement(
+            session,
+            "recommend_products",
+            [mistral_query, int(user_id), SEARCH_CANDIDATES, RERANK_TOP_K, 0.0],
+            to_pandas=True,
+        )
+    except Exception as e:
+        logger.error(f"Error running RECOMMEND_PRODUCTS: {str(e)}")
+        return pd.DataFrame()
+
+    logger.debug(f"RECOMMEND_PRODUCTS returned {len(df)} rows.")
+    return apply_product_schema(df)
+
+
+def run_recommendation_procedure(session, human_query, user_id):
+    """
+    Runs the pipeline server side: one CALL after the (usually cached) query rewrite.
+    The rewrite and DDL checks run concurrently before it; store upkeep is only started
+    in the background (see schedule_store_upkeep).
+    """
+    schedule_store_upkeep()
+    results = run_stage_graph({
+        "rewrite": (lambda r: rewrite_query(session, human_query), []),
+        "procedure": (
+            lambda r: ensure_recommendation_procedure(session, ensure_cortex_search_service(session)),
+            [],
+        ),
+        "recommend": (
+            lambda r: call_recommendation_procedure(session, r["rewrite"], user_id),
+            ["rewrite", "procedure"],
+        ),
+    })
+    return results["recommend"]
+
+
+def get_recommendations(session, human_query, user_id):
+    """
+    Runs the recommendation pipeline for one search.
+
+    In "procedure" mode the whole pipeline is a single CALL. In "staged" mode with the
+    warehouse re-rank every run works in its own set of temporary tables (see
+    pipeline_tables), which are dropped when the run finishes, so searches from different
+    users can run in parallel. The local re-rank passes product IDs between its stages
+    and creates no tables, so there is nothing to drop.
+    """
+    if PIPELINE_MODE == "procedure":
+        return run_recommendation_procedure(session, human_query, user_id)
+    if RERANK_BACKEND == "local":
+        return run_recommendation_pipeline(session, human_query, user_id)
+
+    tables = pipeline_tables()
+    try:
+        return run_recommendation_pipeline(session, human_query, user_id, tables)
+    finally:
+        cleanup_tables(session, tables)
+
+
+def rerank_candidates(session, profile_vec, candidate_ids):
+    """
+    Scores the first-pass hits against the user's profile in process and returns the
+    PRODUCT_IDs of the best RERANK_TOP_K of them.
+    """
+    product_ids = []
+    if profile_vec is not None and candidate_ids:
+        ranked = get_product_index(session).search(
+            profile_vec, RERANK_TOP_K, candidate_ids=candidate_ids, threshold=0.0
+        )
+        product_ids = [product_id for product_id, _ in ranked]
+    logger.debug(f"Re-ranked {len(candidate_ids)} candidates locally, kept {len(product_ids)}")
+    return product_ids
+
+
+def run_recommendation_pipeline(session, human_query, user_id, tables=None):
+    """
+    Runs the pipeline stage by stage from the client as a dependency graph: the rewrite
+    and the search service check run concurrently, the user's context is prepared while
+    the first-pass search runs, and only the re-rank waits for both. The final search is
+    the "fetch" stage. Store upkeep is only started in the background (see
+    schedule_store_upkeep); the stages read the embeddings that already exist.
+
+    tables (see pipeline_tables) is only used by the warehouse re-rank.
+    """
+    schedule_store_upkeep()
+    stages = {
+        "rewrite": (lambda r: rewrite_query(session, human_query), []),
+        "service": (lambda r: ensure_cortex_search_service(session), []),
+    }
+
+    if RERANK_BACKEND == "local":
+        # Score the first-pass hits against the user's profile in process and hand the
+        # winners straight to the final search
+        stages.update({
+            "search": (lambda r: search_candidate_ids(session, r["rewrite"]), ["rewrite", "service"]),
+            "context": (lambda r: get_profile_vector(session, user_id), []),
+            "index": (lambda r: get_product_index(session), []),
+            "rerank": (
+                lambda r: rerank_candidates(session, r["context"], r["search"]),
+                ["search", "context", "index"],
+            ),
+            "fetch": (
+                lambda r: filter_augment_table(session, r["rewrite"], tables, product_ids=r["rerank"]),
+                ["rewrite", "rerank"],
+            ),
+        })
+    else:
+        stages.update({
+            "search": (lambda r: filter_temp_table(session, r["rewrite"], tables), ["rewrite", "service"]),
+            "context": (lambda r: construct_context(session, user_id, tables), []),
+            "rerank": (
+                lambda r: perform_semantic_search(session, user_id, tables, top_k=RERANK_TOP_K, threshold=0.0),
+                ["search", "context"],
+            ),
+            "fetch": (lambda r: filter_augment_table(session, r["rewrite"], tables), ["rewrite", "rerank"]),
+        })
+
+    return run_stage_graph(stages)["fetch"]
+
+# Finished searches are cached per (normalized query, user, profile version). A user's
+# profile version is bumped on every interaction they log in this process, so a like or
+# purchase immediately routes their next search past the cache; the TTL bounds how long
+# interactions logged by other processes can go unnoticed.
+RESULT_CACHE_SIZE = 1000
+RESULT_CACHE_TTL = 900
+
+_recommendation_cache = TTLCache(max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+_profile_versions = {}
+_profile_versions_lock = threading.Lock()
+
+
+def get_profile_version(user_id):
+    with _profile_versions_lock:
+        return _profile_versions.get(user_id, 0)
+
+
+def bump_profile_version(user_id):
+    """
+    Invalidates the cached recommendations of a user after their profile changed.
+    """
+    with _profile_versions_lock:
+        _profile_versions[user_id] = _profile_versions.get(user_id, 0) + 1
+        return _profile_versions[user_id]
+
+
+def recommendation_cache_key(human_query, user_id):
+    return (normalize_query(human_query), user_id, get_profile_version(user_id))
+
+
+def cached_recommendations(key):
+    """
+    Returns a copy of the cached recommendations for key, or None on a miss.
+    """
+    with span("cache") as item:
+        cached = _recommendation_cache.get(key)
+        item.record_result(cached)
+    return None if cached is None else cached.copy()
+
+
+def compute_recommendations(session, human_query, user_id, key):
+    """
+    Runs the pipeline for a search that missed the cache and caches its result under key.
+    """
+    df = get_recommendations(session, human_query, user_id)
+    if not df.empty:
+        _recommendation_cache.set(key, df.copy())
+        remember_products(df)
+    return df
+
+
+def fetch_recommendations(session, human_query, user_id):
+    """
+    Returns the recommendations for a search, running the pipeline only on a cache miss.
+    The search is traced (see mindmart.tracing) unless it is part of a trace already.
+    """
+    with traced("search", query=human_query, user_id=user_id):
+        key = recommendation_cache_key(human_query, user_id)
+        cached = cached_recommendations(key)
+        if cached is not None:
+            return cached
+        return compute_recommendations(session, human_query, user_id, key)
+
+
+# Streamed searches run the full pipeline and the preview search on their own threads,
+# since the pipeline itself waits on _stage_executor.
+_stream_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="stream")
+
+
+def preview_recommendations(session, query, limit=GRID_PAGE_SIZE):
+    """
+    Returns the plain Cortex hits of a search query, without rewrite or personalization.
+    """
+    with span("preview") as item:
+        df = search_products(session, query, limit=limit)
+        item.record_result(df)
+    logger.debug(f"Preview search returned {len(df)} rows.")
+    return df
+
+
+def stream_recommendations(session, human_query, user_id):
+    """
+    Runs a search and yields its results as they improve, so the UI can show the
+    first-pass hits while the personalized re-rank is still running.
+
+    The full pipeline is started first; the preview searches the query as typed, so it
+    never waits for the rewrite. Both use the caller's session, so the generator only
+    exits after both have finished or been cancelled, even if the caller stops iterating.
+
+    Yields:
+        tuple: ("preview", df) with the plain Cortex hits, if they arrive before the
+            final results, then ("final", df) with the recommendations (see
+            fetch_recommendations). Cached searches yield only the final results.
+    """
+    # The trace is only made current around the work of this generator, never across a
+    # yield, since the caller's thread runs other code in between
+    trace = Trace("search", query=human_query, user_id=user_id, streamed=True)
+    key = recommendation_cache_key(human_query, user_id)
+    with use_trace(trace):
+        cached = cached_recommendations(key)
+    if cached is not None:
+        trace.finish()
+        yield "final", cached
+        return
+
+    final = _stream_executor.submit(
+        bind_trace(compute_recommendations, trace), session, human_query, user_id, key
+    )
+    preview = _stream_executor.submit(
+        bind_trace(preview_recommendations, trace), session, human_query
+    )
+    try:
+        wait([final, preview], return_when=FIRST_COMPLETED)
+        if not final.done():
+            try:
+                df = preview.result()
+                if not df.empty and not final.done():
+                    yield "preview", df
+            except Exception as e:
+                logger.error(f"Error in preview search: {str(e)}")
+
+        yield "final", final.result()
+    finally:
+        # The caller returns the session to the pool once this generator exits
+        preview.cancel()
+        final.cancel()
+        wait([final, preview])
+        trace.finish()
@@ -0,0 +1,184 @@
+"""Incrementally maintained user profile vectors."""
+
+from .embeddings import PRODUCT_EMBEDDING_MODEL, PRODUCT_EMBEDDING_VERSION, ensure_product_embeddings_table
+from .statements import execute_statement
+from .tracing import run_query
+from .vector_index import as_vector
+
+
+# Relative weight of each interaction type in a user's profile vector, and the half-life
+# after which an interaction counts half as much.
+INTERACTION_WEIGHTS = {
+    "view": 1.0,
+    "like": 2.0,
+    "add_to_cart": 3.0,
+    "purchase": 5.0,
+}
+PROFILE_HALF_LIFE_DAYS = 30
+
+_user_profile_table_ready = False
+
+
+def ensure_user_profile_table(session):
+    """
+    Creates USER_PROFILE_VECTORS on first use in this process.
+    """
+    global _user_profile_table_ready
+
+    if _user_profile_table_ready:
+        return
+    session.sql("""
+        CREATE TABLE IF NOT EXISTS USER_PROFILE_VECTORS (
+            USER_ID NUMBER,
+            PROFILE_VEC VECTOR(FLOAT, 768),
+            TOTAL_WEIGHT FLOAT,
+            INTERACTION_COUNT NUMBER,
+            PROFILE_VERSION NUMBER,
+            UPDATED_AT TIMESTAMP_NTZ
+        )
+    """).collect()
+    _user_profile_table_ready = True
+
+
+def update_user_profiles(session, events_sql):
+    """
+    Folds a set of interactions into the users' profile vectors in one MERGE.
+
+    A profile is the sum of the embeddings of the products a user interacted with,
+    weighted by INTERACTION_WEIGHTS and decayed with PROFILE_HALF_LIFE_DAYS. It is stored
+    as of UPDATED_AT, so new events only need the stored vector decayed to the newest
+    event time plus their own decayed contributions; the history is never re-read.
+    Products without a stored embedding do not contribute.
+
+    Args:
+        session: Snowpark session object
+        events_sql (str): Query returning USER_ID, PRODUCT_ID, INTERACTION_TYPE and
+            INTERACTION_TIMESTAMP columns.
+
+    Returns:
+        None
+    """
+    ensure_user_profile_table(session)
+    ensure_product_embeddings_table(session)
+
+    half_life_seconds = PROFILE_HALF_LIFE_DAYS * 24 * 3600
+    weight_case = " ".join(
+        f"WHEN '{interaction_type}' THEN {weight}"
+        for interaction_type, weight in INTERACTION_WEIGHTS.items()
+    )
+
+    run_query(session.sql(f"""
+        MERGE INTO USER_PROFILE_VECTORS t
+        USING (
+            WITH events AS (
+                {events_sql}
+            ),
+            weighted AS (
+                SELECT
+                    ev.USER_ID,
+                    ev.PRODUCT_ID,
+                    ev.INTERACTION_TIMESTAMP::TIMESTAMP_NTZ AS TS,
+                    CASE LOWER(ev.INTERACTION_TYPE) {weight_case} ELSE 0 END AS WEIGHT
+                FROM events ev
+            ),
+            horizon AS (
+                SELECT
+                    w.USER_ID,
+                    GREATEST(MAX(w.TS), COALESCE(MAX(p.UPDATED_AT), MAX(w.TS))) AS AS_OF,
+                    COUNT(*) AS EVENTS
+                FROM weighted w
+                LEFT JOIN USER_PROFILE_VECTORS p ON p.USER_ID = w.USER_ID
+                GROUP BY w.USER_ID
+            ),
+            contributions AS (
+                SELECT
+                    w.USER_ID,
+                    f.INDEX AS DIM,
+                    f.VALUE::FLOAT * w.WEIGHT
+                        * POWER(0.5, DATEDIFF('second', w.TS, h.AS_OF) / {half_life_seconds}) AS VAL
+                FROM weighted w
+                JOIN horizon h ON h.USER_ID = w.USER_ID
+                JOIN PRODUCT_EMBEDDINGS e
+                    ON e.PRODUCT_ID = w.PRODUCT_ID
+                    AND e.EMBEDDING_MODEL = '{PRODUCT_EMBEDDING_MODEL}'
+                    AND e.EMBEDDING_VERSION = {PRODUCT_EMBEDDING_VERSION},
+                LATERAL FLATTEN(input => e.PRODUCT_VEC::ARRAY) f
+                UNION ALL
+                SELECT
+                    p.USER_ID,
+                    f.INDEX AS DIM,
+                    f.VALUE::FLOAT
+                        * POWER(0.5, DATEDIFF('second', p.UPDATED_AT, h.AS_OF) / {half_life_seconds}) AS VAL
+                FROM USER_PROFILE_VECTORS p
+                JOIN horizon h ON h.USER_ID = p.USER_ID,
+                LATERAL FLATTEN(input => p.PROFILE_VEC::ARRAY) f
+            ),
+            vectors AS (
+                SELECT
+                    USER_ID,
+                    ARRAY_AGG(VAL) WITHIN GROUP (ORDER BY DIM)::VECTOR(FLOAT, 768) AS PROFILE_VEC
+                FROM (
+                    SELECT USER_ID, DIM, SUM(VAL) AS VAL
+                    FROM contributions
+                    GROUP BY USER_ID, DIM
+                )
+                GROUP BY USER_ID
+            ),
+            weights AS (
+                SELECT
+                    w.USER_ID,
+                    SUM(w.WEIGHT * POWER(0.5, DATEDIFF('second', w.TS, h.AS_OF) / {half_life_seconds})) AS WEIGHT
+                FROM weighted w
+                JOIN horizon h ON h.USER_ID = w.USER_ID
+                GROUP BY w.USER_ID
+            )
+            SELECT
+                h.USER_ID,
+                v.PROFILE_VEC,
+                COALESCE(
+                    p.TOTAL_WEIGHT * POWER(0.5, DATEDIFF('second', p.UPDATED_AT, h.AS_OF) / {half_life_seconds}),
+                    0
+                ) + wt.WEIGHT AS TOTAL_WEIGHT,
+                h.EVENTS,
+                h.AS_OF
+            FROM horizon h
+            JOIN vectors v ON v.USER_ID = h.USER_ID
+            JOIN weights wt ON wt.USER_ID = h.USER_ID
+            LEFT JOIN USER_PROFILE_VECTORS p ON p.USER_ID = h.USER_ID
+        ) s
+        ON t.USER_ID = s.USER_ID
+        WHEN MATCHED THEN UPDATE SET
+            PROFILE_VEC = s.PROFILE_VEC,
+            TOTAL_WEIGHT = s.TOTAL_WEIGHT,
+            INTERACTION_COUNT = t.INTERACTION_COUNT + s.EVENTS,
+            PROFILE_VERSION = t.PROFILE_VERSION + 1,
+            UPDATED_AT = s.AS_OF
+        WHEN NOT MATCHED THEN INSERT
+            (USER_ID, PROFILE_VEC, TOTAL_WEIGHT, INTERACTION_COUNT, PROFILE_VERSION, UPDATED_AT)
+        VALUES
+            (s.USER_ID, s.PROFILE_VEC, s.TOTAL_WEIGHT, s.EVENTS, 1, s.AS_OF)
+    """))
+
+
+def backfill_user_profiles(session):
+    """
+    Builds profile vectors from the full interaction history of users that do not have
+    one yet (e.g. interactions logged before profiles existed).
+    """
+    ensure_user_profile_table(session)
+    update_user_profiles(session, """
+        SELECT USER_ID, PRODUCT_ID, INTERACTION_TYPE, INTERACTION_TIMESTAMP
+        FROM USER_INTERACTION_TABLE
+        WHERE USER_ID NOT IN (SELECT USER_ID FROM USER_PROFILE_VECTORS)
+    """)
+
+
+def get_profile_vector(session, user_id):
+    """
+    Returns the user's profile vector as float32, or None if the user has no profile yet.
+    """
+    ensure_user_profile_table(session)
+    result = execute_statement(session, "get_profile_vector", [int(user_id)])
+    if not result or result[0]["PROFILE_VEC"] is None:
+        return None
+    return as_vector(result[0]["PROFILE_VEC"])
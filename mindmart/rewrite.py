@@ -0,0 +1,177 @@
+"""LLM query rewriting with memory and on-disk caches."""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .cache import TTLCache
+from .config import CACHE_DIR
+from .statements import execute_statement
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRewriteStore:
+    """
+    SQLite file holding query rewrites, so they survive restarts and are shared by all
+    app processes on the host. Entries older than ttl seconds are ignored.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_rewrites (
+                    cache_key TEXT PRIMARY KEY,
+                    user_query TEXT,
+                    rewrite TEXT,
+                    created_at REAL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT rewrite FROM query_rewrites WHERE cache_key = ? AND created_at > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, user_query, rewrite):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_rewrites VALUES (?, ?, ?, ?)",
+                (key, user_query, rewrite, time.time()),
+            )
+
+
+# Bump REWRITE_PROMPT_VERSION whenever the prompt or model changes so cached rewrites
+# produced by the old prompt are no longer used.
+REWRITE_MODEL = "mistral-large"
+REWRITE_PROMPT_VERSION = 1
+REWRITE_CACHE_SIZE = 5000
+REWRITE_CACHE_TTL = 7 * 24 * 3600
+
+_rewrite_cache = TTLCache(max_size=REWRITE_CACHE_SIZE, ttl=REWRITE_CACHE_TTL)
+_rewrite_store = None
+_rewrite_store_lock = threading.Lock()
+_rewrite_store_hits = 0
+
+
+def get_rewrite_store():
+    """
+    Returns the on-disk rewrite store, or None if the cache directory is not writable.
+    """
+    global _rewrite_store
+
+    with _rewrite_store_lock:
+        if _rewrite_store is None:
+            try:
+                _rewrite_store = QueryRewriteStore(
+                    os.path.join(CACHE_DIR, "query_rewrites.sqlite3"), REWRITE_CACHE_TTL
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Query rewrite store unavailable: {str(e)}")
+                _rewrite_store = False
+        return _rewrite_store or None
+
+
+def normalize_query(user_query):
+    """
+    Normalizes a search query for cache lookups: case, quotes and whitespace are ignored.
+    """
+    return " ".join(user_query.replace('"', " ").replace("'", " ").lower().split())
+
+
+def rewrite_cache_key(user_query):
+    """
+    Returns the rewrite cache key for a query under the current model and prompt version.
+    """
+    payload = f"{REWRITE_MODEL}:{REWRITE_PROMPT_VERSION}:{normalize_query(user_query)}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def rewrite_cache_stats():
+    """
+    Returns the hit/miss counters of the query rewrite cache. Disk hits are in-memory
+    misses that were answered by the on-disk store instead of the LLM.
+    """
+    stats = _rewrite_cache.stats()
+    stats["disk_hits"] = _rewrite_store_hits
+    stats["llm_calls"] = stats["misses"] - _rewrite_store_hits
+    return stats
+
+
+def get_mistral_query(session, user_query):
+    """
+    Get Mistral LLM output using SNOWFLAKE.CORTEX.COMPLETE
+
+    Rewrites are cached by normalized query and prompt version, first in memory (shared
+    by all Streamlit sessions of the process) and then on disk (shared across restarts).
+    
+    Args:
+        session: Snowpark session object
+        user_query: User's query string
+    
+    Returns:
+        str: SQL query generated by Mistral
+    """
+    global _rewrite_store_hits
+
+    key = rewrite_cache_key(user_query)
+    cached = _rewrite_cache.get(key)
+    if cached is not None:
+        return cached
+
+    store = get_rewrite_store()
+    if store is not None:
+        try:
+            stored = store.get(key)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading query rewrite store: {str(e)}")
+            stored = None
+        if stored is not None:
+            _rewrite_store_hits += 1
+            _rewrite_cache.set(key, stored)
+            return stored
+
+    try:
+        # Define the prompt template
+        prompt_template = f"""
+        You are an advanced language model designed to understand and transform human queries into structured semantic search queries.
+        
+        **Task**: Convert the following human query into a concise and relevant query focused on finding similar product titles in the `products` table. The output should preserve the user's intent and be well-suited for similarity comparison with the `TITLE` column.
+        
+        **Human Query**: {user_query}
+        
+        **output should only contain the rephrased query nothing else.**
+        """
+        
+        # Call SNOWFLAKE.CORTEX.COMPLETE with the model and prompt as bind variables
+        result = execute_statement(session, "rewrite_query", [REWRITE_MODEL, prompt_template])
+        
+        # Check if the result is valid
+        if not result or len(result) == 0:
+            raise ValueError("No response received from Mistral")
+        
+        # Return the cleaned-up response
+        rewrite = result[0]["RESPONSE"].strip()
+        
+    except Exception as e:
+        raise Exception(f"Error generating SQL query: {str(e)}")
+
+    _rewrite_cache.set(key, rewrite)
+    if store is not None:
+        try:
+            store.set(key, normalize_query(user_query), rewrite)
+        except sqlite3.Error as e:
+            logger.error(f"Error writing query rewrite store: {str(e)}")
+    return rewrite
@@ -0,0 +1,83 @@
+"""Typed schema of product rows shared by DDL, uploads and client frames."""
+
+import pandas as pd
+
+
+# Declared product schema: Snowflake type and pandas dtype of every product column. It is
+# used for table DDL, for typing search results on the warehouse and for client frames,
+# so numbers arrive as numbers and the render path never has to cast them again.
+PRODUCT_SCHEMA = {
+    "PRODUCT_ID": ("NUMBER", "Int64"),
+    "TITLE": ("VARCHAR", "string"),
+    "DESCRIPTION": ("VARCHAR", "string"),
+    "HIGHLIGHTS": ("VARCHAR", "string"),
+    "IMAGE_LINKS": ("VARCHAR", "string"),
+    "CATEGORY_1": ("VARCHAR", "category"),
+    "CATEGORY_2": ("VARCHAR", "category"),
+    "CATEGORY_3": ("VARCHAR", "category"),
+    "SELLER_NAME": ("VARCHAR", "category"),
+    "MRP": ("FLOAT", "float32"),
+    "PRODUCT_RATING": ("FLOAT", "float32"),
+    "SELLER_RATING": ("FLOAT", "float32"),
+}
+
+
+def product_column_sql(expression: str, column: str) -> str:
+    """
+    Cast a VARIANT/VARCHAR expression to the declared Snowflake type of a product column.
+    Values that do not parse become NULL instead of failing the query.
+    """
+    sql_type = PRODUCT_SCHEMA.get(column, ("VARCHAR", None))[0]
+    if sql_type == "VARCHAR":
+        return f"{expression}::VARCHAR"
+    return f"TRY_CAST({expression}::VARCHAR AS {sql_type})"
+
+
+# Product columns returned by every search
+SEARCH_COLUMNS = [
+    "CATEGORY_1", "CATEGORY_2", "CATEGORY_3", "DESCRIPTION",
+    "HIGHLIGHTS", "IMAGE_LINKS", "MRP", "PRODUCT_ID", 
+    "PRODUCT_RATING", "SELLER_NAME", "SELLER_RATING", "TITLE"
+]
+
+
+def search_results_sql(service_argument: str = "?", search_argument: str = "?") -> str:
+    """
+    Build a SELECT over the hits of a Cortex search, unnested on the warehouse with FLATTEN.
+
+    Every hit becomes one row with the SEARCH_COLUMNS, typed per PRODUCT_SCHEMA, plus
+    SEARCH_RANK (0 is the best match), so results can feed further SQL stages without
+    leaving Snowflake.
+
+    Args:
+        service_argument (str): SQL expression holding the fully qualified search service
+            name; a bind variable by default.
+        search_argument (str): SQL expression holding the JSON search configuration; a
+            bind variable by default, or e.g. a scripting variable.
+    """
+    columns = ",\n            ".join(
+        f"{product_column_sql(f'r.value:{column}', column)} AS {column}" for column in SEARCH_COLUMNS
+    )
+    return f"""
+        SELECT
+            {columns},
+            r.index AS SEARCH_RANK
+        FROM TABLE(FLATTEN(
+            PARSE_JSON(SNOWFLAKE.CORTEX.SEARCH_PREVIEW({service_argument}, {search_argument})):results
+        )) r
+    """
+
+
+def apply_product_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the product columns of a DataFrame to their declared dtypes, column at a time.
+    Columns outside PRODUCT_SCHEMA are left untouched.
+    """
+    for column, (_, dtype) in PRODUCT_SCHEMA.items():
+        if column not in df.columns:
+            continue
+        if dtype in ("Int64", "float32"):
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
@@ -0,0 +1,309 @@
+"""Cortex Search service management and first-pass product search."""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from .config import SEARCH_CANDIDATES, SEARCH_WAREHOUSE, SNOWFLAKE_CONFIG
+from .schema import SEARCH_COLUMNS, apply_product_schema
+from .statements import execute_statement
+from .tracing import run_query
+from .vector_index import normalize_product_id
+
+logger = logging.getLogger(__name__)
+
+
+# Definition of the catalog search service. Everything that affects how the index is
+# built is listed here so it can be fingerprinted; changing any of these values causes
+# a rebuild the next time the service is requested.
+PRODUCT_SEARCH_SERVICE = {
+    "name": "PRODUCT_SEARCH_SERVICE",
+    "source_table": "PRODUCT_TABLE",
+    "search_column": "TITLE",
+    "attributes": ["CATEGORY_1", "CATEGORY_2", "CATEGORY_3", "HIGHLIGHTS", "MRP", "PRODUCT_ID"],
+    "warehouse": SEARCH_WAREHOUSE,
+    "target_lag": "1 day",
+    "embedding_model": "snowflake-arctic-embed-l-v2.0",
+}
+
+# How often (seconds) a process re-validates the registry entry for a service it has
+# already seen. Between checks the service name is returned without touching the warehouse.
+SEARCH_SERVICE_CHECK_INTERVAL = 600
+
+_search_service_registry = {}
+_search_service_registry_ready = False
+_search_service_lock = threading.Lock()
+_search_service_build_lock = threading.Lock()
+
+
+def search_service_fingerprint(definition, catalog_columns):
+    """
+    Fingerprint a search service definition together with the catalog columns it indexes.
+
+    Args:
+        definition (dict): Search service definition (see PRODUCT_SEARCH_SERVICE).
+        catalog_columns (list): (column name, data type) pairs of the source table.
+
+    Returns:
+        str: Hex digest identifying this exact service build.
+    """
+    payload = json.dumps(
+        {"definition": definition, "catalog_columns": catalog_columns},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_catalog_columns(session, table_name):
+    """
+    Returns the (column name, data type) pairs of a table in the current schema.
+    """
+    rows = execute_statement(session, "get_catalog_columns", [table_name.upper()])
+    return [[row["COLUMN_NAME"], row["DATA_TYPE"]] for row in rows]
+
+
+def create_cortex_search_service(session, definition):
+    """
+    Creates (or replaces) a Cortex Search Service from its definition.
+
+    Args:
+        session: The Snowflake session/connection object.
+        definition (dict): Search service definition (see PRODUCT_SEARCH_SERVICE).
+
+    Returns:
+        None
+    """
+    run_query(session.sql(f"""
+        CREATE OR REPLACE CORTEX SEARCH SERVICE {definition["name"]}
+        ON {definition["search_column"]}
+        ATTRIBUTES {", ".join(definition["attributes"])}
+        WAREHOUSE = {definition["warehouse"]}
+        TARGET_LAG = '{definition["target_lag"]}'
+        EMBEDDING_MODEL = '{definition["embedding_model"]}'
+        AS (
+            SELECT
+                *
+            FROM {definition["source_table"]}
+        );
+    """))
+
+
+def ensure_search_service_registry(session):
+    """
+    Creates SEARCH_SERVICE_REGISTRY on first use in this process.
+    """
+    global _search_service_registry_ready
+
+    if _search_service_registry_ready:
+        return
+    run_query(session.sql("""
+        CREATE TABLE IF NOT EXISTS SEARCH_SERVICE_REGISTRY (
+            SERVICE_NAME VARCHAR,
+            FINGERPRINT VARCHAR,
+            DEFINITION VARIANT,
+            CREATED_AT TIMESTAMP_NTZ
+        )
+    """))
+    _search_service_registry_ready = True
+
+
+def validate_cortex_search_service(session, definition):
+    """
+    Builds a search service if it is missing or its registered fingerprint no longer
+    matches its definition and catalog columns, and returns the current fingerprint.
+    """
+    name = definition["name"]
+    fingerprint = search_service_fingerprint(
+        definition, get_catalog_columns(session, definition["source_table"])
+    )
+
+    ensure_search_service_registry(session)
+    registered = execute_statement(session, "get_search_service_fingerprint", [name])
+    exists = run_query(session.sql(f"SHOW CORTEX SEARCH SERVICES LIKE '{name}'"))
+
+    if not exists or not registered or registered[0]["FINGERPRINT"] != fingerprint:
+        logger.info(f"Building Cortex Search Service {name} ({fingerprint[:12]})")
+        create_cortex_search_service(session, definition)
+        execute_statement(
+            session, "register_search_service", [name, fingerprint, json.dumps(definition)]
+        )
+
+    return fingerprint
+
+
+def ensure_cortex_search_service(session, definition=PRODUCT_SEARCH_SERVICE):
+    """
+    Returns the fully qualified name of a search service, building it only when needed.
+
+    The fingerprint of every built service is stored in SEARCH_SERVICE_REGISTRY so that
+    other processes (and restarts) reuse it. The service is rebuilt only if it is missing
+    or its definition / catalog columns no longer match the registered fingerprint. Row
+    level catalog changes are picked up by the service itself through TARGET_LAG.
+
+    Only the first use in a process waits for the check (and a build, if needed). Once a
+    service has been validated, the periodic re-check runs in one caller while all others
+    keep getting the name without waiting.
+
+    Args:
+        session: Snowpark session object
+        definition (dict): Search service definition (see PRODUCT_SEARCH_SERVICE).
+
+    Returns:
+        str: Fully qualified service name to pass to SEARCH_PREVIEW.
+    """
+    name = definition["name"]
+    qualified_name = f"{SNOWFLAKE_CONFIG['database']}.{SNOWFLAKE_CONFIG['schema']}.{name}"
+
+    with _search_service_lock:
+        entry = _search_service_registry.get(name)
+        if entry is not None:
+            if entry["checking"] or time.monotonic() - entry["checked_at"] < SEARCH_SERVICE_CHECK_INTERVAL:
+                return qualified_name
+            entry["checking"] = True
+
+    with _search_service_build_lock:
+        # Another caller may have validated the service while this one waited
+        current = _search_service_registry.get(name)
+        if current is not entry and current is not None:
+            return qualified_name
+        try:
+            fingerprint = validate_cortex_search_service(session, definition)
+        except Exception as e:
+            if entry is None:
+                raise
+            # The service was valid at the last check; keep serving it until the next one
+            logger.error(f"Error re-checking Cortex Search Service {name}: {str(e)}")
+            with _search_service_lock:
+                entry["checking"] = False
+                entry["checked_at"] = time.monotonic()
+            return qualified_name
+        with _search_service_lock:
+            _search_service_registry[name] = {
+                "fingerprint": fingerprint,
+                "checked_at": time.monotonic(),
+                "checking": False,
+            }
+
+    return qualified_name
+
+
+def create_search_config(user_query: str, filter: dict = None, limit: int = None) -> dict:
+    """
+    Create a search configuration dictionary based on the user query.
+    """
+    config = {
+        "query": user_query,
+        "columns": list(SEARCH_COLUMNS),
+    }
+    if filter is not None:
+        config["filter"] = filter
+    if limit is not None:
+        config["limit"] = limit
+    return config
+
+def filter_temp_table(session, user_query, tables):
+    """
+    Runs the first-pass search and materializes its hits in the run's TEMP_TABLE
+    directly on the warehouse; nothing is downloaded.
+    """
+    try:
+        # Reuse the catalog search service (built only when its definition changes)
+        service_name = ensure_cortex_search_service(session)
+
+        # Create search configuration
+        search_config = create_search_config(user_query, limit=SEARCH_CANDIDATES)
+
+        # Convert the search configuration to a JSON string
+        search_json = json.dumps(search_config)
+
+        # Debug: Print the search JSON to ensure it's correctly formatted
+        logger.debug("Search JSON: %s", search_json)
+
+        execute_statement(session, "search_into_table", [tables["TEMP_TABLE"], service_name, search_json])
+        
+    except Exception as e:
+        logger.error(f"Error in filter_temp_table: {str(e)}")
+
+
+def search_candidate_ids(session, user_query):
+    """
+    Runs the first-pass search and returns only the PRODUCT_IDs of its hits, best first.
+    Used when the re-rank runs locally and needs nothing else from the candidates.
+    """
+    try:
+        service_name = ensure_cortex_search_service(session)
+        search_json = json.dumps(create_search_config(user_query, limit=SEARCH_CANDIDATES))
+        logger.debug("Search JSON: %s", search_json)
+
+        rows = execute_statement(session, "search_candidate_ids", [service_name, search_json])
+        return [row["PRODUCT_ID"] for row in rows]
+
+    except Exception as e:
+        logger.error(f"Error in search_candidate_ids: {str(e)}")
+        return []
+
+
+def search_products(session, user_query, limit=None):
+    """
+    Runs a plain catalog search and returns its rows in search order, e.g. to show the
+    first-pass hits while the personalized pipeline is still running.
+    """
+    try:
+        service_name = ensure_cortex_search_service(session)
+        search_json = json.dumps(create_search_config(user_query, limit=limit))
+        results = execute_statement(session, "search_products", [service_name, search_json], to_pandas=True)
+        return apply_product_schema(results)
+
+    except Exception as e:
+        logger.error(f"Error in search_products: {str(e)}")
+        return pd.DataFrame()
+
+
+def filter_augment_table(session, user_query, tables, product_ids=None):
+    """
+    Runs the final search within the run's AUGMENT_TABLE (or the given product_ids, when
+    the re-rank ran locally) and returns its rows in search order. This is the only
+    stage whose rows are downloaded to the client.
+    """
+    try:
+        # Reuse the catalog search service and restrict it to the augmented products
+        # instead of indexing AUGMENT_TABLE on every search
+        service_name = ensure_cortex_search_service(session)
+
+        if product_ids is None:
+            product_ids = [
+                row["PRODUCT_ID"]
+                for row in execute_statement(session, "read_augment_ids", [tables["AUGMENT_TABLE"]])
+            ]
+        product_ids = [normalize_product_id(product_id) for product_id in product_ids]
+
+        # Create search configuration. Users without history have an empty
+        # AUGMENT_TABLE, in which case we fall back to the plain catalog search.
+        if product_ids:
+            search_filter = {"@or": [{"@eq": {"PRODUCT_ID": product_id}} for product_id in product_ids]}
+            search_config = create_search_config(user_query, filter=search_filter, limit=len(product_ids))
+        else:
+            search_config = create_search_config(user_query)
+
+        # Convert the search configuration to a JSON string
+        search_json = json.dumps(search_config, default=str)
+
+        # Debug: Print the search JSON to ensure it's correctly formatted
+        logger.debug("Search JSON: %s", search_json)
+
+        results = execute_statement(session, "search_products", [service_name, search_json], to_pandas=True)
+
+        if results.empty:
+            logger.debug("Search returned no matching results")
+            return pd.DataFrame()
+
+        return apply_product_schema(results)
+        
+    except Exception as e:
+        logger.error(f"Error in filter_augment_table: {str(e)}")
+        return pd.DataFrame()
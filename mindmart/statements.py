@@ -0,0 +1,157 @@
+"""Registry of named, parameterized SQL statements executed with bind variables."""
+
+import threading
+import time
+
+from .schema import search_results_sql
+from .tracing import run_query
+
+# Hot statements of the app. Values are never formatted into the text: they are passed as
+# qmark bind variables, and working tables as IDENTIFIER(?), so every call of a statement
+# sends the same SQL text and the warehouse can reuse its compiled plan and result cache.
+STATEMENTS = {
+    "login_user": """
+        SELECT USER_ID, USERNAME
+        FROM USER_TABLE
+        WHERE USERNAME = ?
+        AND PASSWORD_HASH = ?
+    """,
+    "register_user": """
+        MERGE INTO USER_TABLE t
+        USING (SELECT ? AS USERNAME, ? AS EMAIL, ? AS PASSWORD_HASH) s
+        ON t.USERNAME = s.USERNAME OR t.EMAIL = s.EMAIL
+        WHEN NOT MATCHED THEN
+            INSERT (USERNAME, EMAIL, PASSWORD_HASH)
+            VALUES (s.USERNAME, s.EMAIL, s.PASSWORD_HASH)
+    """,
+    "get_user_history_products": """
+        SELECT p.*
+        FROM PRODUCT_TABLE p
+        JOIN (
+            SELECT PRODUCT_ID, MAX(INTERACTION_TIMESTAMP) AS LAST_INTERACTION
+            FROM USER_INTERACTION_TABLE
+            WHERE USER_ID = ?
+            GROUP BY PRODUCT_ID
+            QUALIFY ROW_NUMBER() OVER (ORDER BY LAST_INTERACTION DESC) <= ?
+        ) u ON p.PRODUCT_ID = u.PRODUCT_ID
+        ORDER BY u.LAST_INTERACTION DESC
+    """,
+    "get_profile_vector": """
+        SELECT PROFILE_VEC::ARRAY AS PROFILE_VEC
+        FROM USER_PROFILE_VECTORS
+        WHERE USER_ID = ?
+    """,
+    "construct_context": """
+        CREATE OR REPLACE TEMPORARY TABLE IDENTIFIER(?) AS
+        SELECT
+            USER_ID,
+            TOTAL_WEIGHT,
+            INTERACTION_COUNT,
+            PROFILE_VERSION,
+            UPDATED_AT,
+            PROFILE_VEC AS context_vec
+        FROM USER_PROFILE_VECTORS
+        WHERE USER_ID = ?
+    """,
+    "read_context": """
+        SELECT * EXCLUDE (context_vec) FROM IDENTIFIER(?)
+    """,
+    "rewrite_query": """
+        SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) AS response
+    """,
+    "recommend_products": """
+        CALL RECOMMEND_PRODUCTS(?, ?, ?, ?, ?)
+    """,
+    # Cortex searches bind the service name and the JSON search configuration, so the
+    # user's query is never part of the text
+    "search_products": f"""
+        {search_results_sql()}
+        ORDER BY SEARCH_RANK
+    """,
+    "search_candidate_ids": f"""
+        SELECT PRODUCT_ID
+        FROM ({search_results_sql()})
+        ORDER BY SEARCH_RANK
+    """,
+    "search_into_table": f"""
+        CREATE OR REPLACE TEMPORARY TABLE IDENTIFIER(?) AS
+        {search_results_sql()}
+    """,
+    "read_augment_ids": """
+        SELECT DISTINCT PRODUCT_ID FROM IDENTIFIER(?)
+    """,
+    "get_catalog_columns": """
+        SELECT COLUMN_NAME, DATA_TYPE
+        FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = CURRENT_SCHEMA()
+        AND TABLE_NAME = ?
+        ORDER BY ORDINAL_POSITION
+    """,
+    "get_search_service_fingerprint": """
+        SELECT FINGERPRINT FROM SEARCH_SERVICE_REGISTRY WHERE SERVICE_NAME = ?
+    """,
+    "register_search_service": """
+        MERGE INTO SEARCH_SERVICE_REGISTRY r
+        USING (
+            SELECT
+                ? AS SERVICE_NAME,
+                ? AS FINGERPRINT,
+                PARSE_JSON(?) AS DEFINITION
+        ) s
+        ON r.SERVICE_NAME = s.SERVICE_NAME
+        WHEN MATCHED THEN UPDATE SET
+            FINGERPRINT = s.FINGERPRINT,
+            DEFINITION = s.DEFINITION,
+            CREATED_AT = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT (SERVICE_NAME, FINGERPRINT, DEFINITION, CREATED_AT)
+            VALUES (s.SERVICE_NAME, s.FINGERPRINT, s.DEFINITION, CURRENT_TIMESTAMP())
+    """,
+}
+
+_statement_stats = {}
+_statement_stats_lock = threading.Lock()
+
+
+def execute_statement(session, name, params=(), to_pandas=False):
+    """
+    Runs a registered statement with bind variables and records its duration. Its query
+    ID is attributed to the current tracing span, if any.
+
+    Args:
+        session: Snowpark session object
+        name (str): Key of the statement in STATEMENTS.
+        params (sequence): Values for the statement's ? placeholders, in order.
+        to_pandas (bool): Return a pandas DataFrame instead of a list of Rows.
+
+    Returns:
+        list | pd.DataFrame: The statement's result.
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        return run_query(session.sql(STATEMENTS[name], params=list(params)), to_pandas=to_pandas)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        with _statement_stats_lock:
+            stats = _statement_stats.setdefault(
+                name, {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+
+
+def statement_stats():
+    """
+    Returns call counts and timings of the registered statements executed so far in this
+    process, keyed by statement name.
+    """
+    with _statement_stats_lock:
+        return {
+            name: dict(stats, avg_seconds=stats["total_seconds"] / stats["calls"])
+            for name, stats in _statement_stats.items()
+        }
@@ -0,0 +1,34 @@
+"""Per-request working tables of the recommendation pipeline."""
+
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+# Working tables written by one run of the recommendation pipeline. Every run gets its
+# own copy (see pipeline_tables) so concurrent searches never share intermediates.
+PIPELINE_TABLES = ("TEMP_TABLE", "CONTEXT_TABLE", "AUGMENT_TABLE")
+
+
+def pipeline_tables(run_id=None):
+    """
+    Returns the working table names for a single pipeline run.
+
+    Args:
+        run_id (str): Identifier of the run. A new random one is generated if omitted.
+
+    Returns:
+        dict: Maps each name in PIPELINE_TABLES to its run-specific table name.
+    """
+    run_id = run_id or uuid.uuid4().hex[:12]
+    return {table: f"{table}_{run_id}".upper() for table in PIPELINE_TABLES}
+
+
+def cleanup_tables(session, tables):
+    """Drop the working tables of a finished pipeline run"""
+    for table_name in tables.values():
+        try:
+            session.sql(f"DROP TABLE IF EXISTS {table_name};").collect()
+        except Exception as e:
+            logger.error(f"Error cleaning up table: {str(e)}")
@@ -0,0 +1,219 @@
+"""Structured spans around the stages of a search."""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+
+from .connection import report_query_error
+
+logger = logging.getLogger(__name__)
+
+# Finished traces kept in memory for the admin panel.
+TRACE_HISTORY = 20
+
+_local = threading.local()
+_recent_traces = deque(maxlen=TRACE_HISTORY)
+_recent_traces_lock = threading.Lock()
+
+
+class Span:
+    """
+    One timed stage of a trace. start is relative to the start of the trace; rows and
+    bytes describe the stage's result, query_ids the Snowflake queries it ran.
+    """
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.rows = None
+        self.bytes = None
+        self.query_ids = []
+        self.error = None
+        self.thread = threading.current_thread().name
+
+    def record_result(self, result):
+        """
+        Sets rows and bytes from a stage result (a DataFrame, or any sized collection).
+        """
+        if isinstance(result, pd.DataFrame):
+            self.rows = len(result)
+            self.bytes = int(result.memory_usage(index=True, deep=False).sum())
+        elif isinstance(result, (list, tuple, set, dict)):
+            self.rows = len(result)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "start_ms": round(self.start * 1000, 1),
+            "duration_ms": round((self.duration or 0) * 1000, 1),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "query_ids": list(self.query_ids),
+            "error": self.error,
+            "thread": self.thread,
+        }
+
+
+class Trace:
+    """
+    The spans of one search, collected from every thread that worked on it.
+    """
+
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.duration = None
+        self.spans = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.duration = self.elapsed()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        logger.info(
+            "trace %s %s %s finished in %.0f ms: %s",
+            self.trace_id, self.name, self.attributes, self.duration * 1000,
+            ", ".join(f"{span.name}={span.duration * 1000:.0f}ms" for span in spans),
+        )
+        with _recent_traces_lock:
+            _recent_traces.append(self)
+
+    def as_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attributes": dict(self.attributes),
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or self.elapsed()) * 1000, 1),
+            "spans": [span.as_dict() for span in spans],
+        }
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def current_span():
+    return getattr(_local, "span", None)
+
+
+@contextmanager
+def use_trace(trace):
+    """
+    Makes trace the current trace of this thread for the duration of the block.
+    """
+    previous = current_trace()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def traced(name, **attributes):
+    """
+    Runs the block as a new trace, or as part of the current one if there is one, and
+    records the finished trace for recent_traces.
+    """
+    if current_trace() is not None:
+        yield current_trace()
+        return
+
+    trace = Trace(name, **attributes)
+    with use_trace(trace):
+        try:
+            yield trace
+        finally:
+            trace.finish()
+
+
+@contextmanager
+def span(name):
+    """
+    Times the block as a span of the current trace and logs it. Queries run through
+    run_query inside the block are attributed to the span.
+    """
+    trace = current_trace()
+    item = Span(name, trace.elapsed() if trace is not None else 0.0)
+    previous = current_span()
+    _local.span = item
+    start = time.perf_counter()
+    try:
+        yield item
+    except Exception as e:
+        item.error = str(e)
+        raise
+    finally:
+        item.duration = time.perf_counter() - start
+        _local.span = previous
+        if trace is not None:
+            trace.add(item)
+        level = logging.WARNING if item.error else logging.DEBUG
+        logger.log(
+            level, "span %s %s: %.0f ms, rows=%s, bytes=%s, query_ids=%s%s",
+            trace.trace_id if trace is not None else "-", name, item.duration * 1000,
+            item.rows, item.bytes, item.query_ids, f", error={item.error}" if item.error else "",
+        )
+
+
+def bind_trace(function, trace=None):
+    """
+    Wraps function so that it runs under trace (by default the caller's current trace),
+    e.g. when it is submitted to an executor thread.
+    """
+    trace = trace or current_trace()
+
+    @wraps(function)
+    def run(*args, **kwargs):
+        with use_trace(trace):
+            return function(*args, **kwargs)
+
+    return run
+
+
+def run_query(df, to_pandas=False):
+    """
+    Executes a Snowpark DataFrame and attributes its query ID to the current span. A
+    failed query is reported to the session pool before the error is re-raised.
+
+    Returns:
+        list | pd.DataFrame: Rows, or a pandas DataFrame if to_pandas is set.
+    """
+    try:
+        job = df.to_pandas(block=False) if to_pandas else df.collect_nowait()
+        item = current_span()
+        if item is not None:
+            item.query_ids.append(job.query_id)
+        return job.result()
+    except Exception:
+        report_query_error(df.session)
+        raise
+
+
+def recent_traces():
+    """
+    Returns the last TRACE_HISTORY finished traces as dicts, newest first.
+    """
+    with _recent_traces_lock:
+        traces = list(_recent_traces)
+    return [trace.as_dict() for trace in reversed(traces)]
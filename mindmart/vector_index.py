@@ -0,0 +1,231 @@
+"""In-process product vector index used for re-ranking."""
+
+import json
+import logging
+import threading
+
+import numpy as np
+
+from .config import VECTOR_INDEX_MODE
+from .embeddings import PRODUCT_EMBEDDING_MODEL, PRODUCT_EMBEDDING_VERSION, ensure_product_embeddings_table
+from .tracing import run_query
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_product_id(product_id):
+    """
+    Returns PRODUCT_ID as an int when it is numeric (search results return it as a string).
+    """
+    try:
+        return int(product_id)
+    except (TypeError, ValueError):
+        return product_id
+
+
+def as_vector(value):
+    """
+    Converts a VECTOR/ARRAY value fetched from Snowflake (list or JSON string) to float32.
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def normalize_rows(vectors):
+    """
+    Scales every row of a float32 matrix to unit length so dot products are cosines.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class ProductVectorIndex:
+    """
+    In-process index over the product vectors stored in PRODUCT_EMBEDDINGS.
+
+    Vectors are kept normalized in one contiguous float32 matrix, so scoring a query
+    against any set of products is a single matrix-vector product. In "ivf" mode the
+    matrix is also clustered into inverted lists and catalog-wide searches only scan the
+    n_probe lists closest to the query.
+    """
+
+    def __init__(self, mode="exact", n_lists=None, n_probe=8, dimensions=768):
+        self.mode = mode
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.product_ids = np.empty(0, dtype=object)
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.rows = {}
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self.loaded_through = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def refresh(self, session):
+        """
+        Loads the embeddings added or changed since the last refresh (all of them on the
+        first call) and returns the number of vectors loaded.
+        """
+        ensure_product_embeddings_table(session)
+        query = f"""
+            SELECT PRODUCT_ID, PRODUCT_VEC::ARRAY AS PRODUCT_VEC, EMBEDDED_AT
+            FROM PRODUCT_EMBEDDINGS
+            WHERE EMBEDDING_MODEL = '{PRODUCT_EMBEDDING_MODEL}'
+            AND EMBEDDING_VERSION = {PRODUCT_EMBEDDING_VERSION}
+        """
+        if self.loaded_through is not None:
+            query += f" AND EMBEDDED_AT > '{self.loaded_through}'"
+        df = run_query(session.sql(query), to_pandas=True)
+        if df.empty:
+            return 0
+
+        product_ids = [normalize_product_id(product_id) for product_id in df["PRODUCT_ID"]]
+        vectors = normalize_rows(np.vstack([as_vector(value) for value in df["PRODUCT_VEC"]]))
+
+        with self.lock:
+            # Copy on write so concurrent searches keep a consistent snapshot
+            matrix = self.vectors.copy()
+            ids = list(self.product_ids)
+            rows = dict(self.rows)
+            new_vectors = []
+            for product_id, vector in zip(product_ids, vectors):
+                if product_id in rows:
+                    matrix[rows[product_id]] = vector
+                else:
+                    rows[product_id] = len(ids)
+                    ids.append(product_id)
+                    new_vectors.append(vector)
+            if new_vectors:
+                matrix = np.vstack([matrix, np.asarray(new_vectors, dtype=np.float32)])
+
+            self.vectors = np.ascontiguousarray(matrix, dtype=np.float32)
+            self.product_ids = np.asarray(ids, dtype=object)
+            self.rows = rows
+            self.loaded_through = df["EMBEDDED_AT"].max()
+
+            if self.mode == "ivf":
+                # Retrain once the index has doubled since the lists were built
+                if self.centroids is None or len(ids) > 2 * self.trained_size:
+                    self._train()
+                else:
+                    self.assignments = self._assign(self.vectors, self.centroids)
+
+        return len(product_ids)
+
+    def _train(self, iterations=10, sample_size=50000):
+        """
+        Builds the IVF lists with spherical k-means over a sample of the vectors.
+        """
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(self.vectors))))
+        rng = np.random.default_rng(0)
+        sample = self.vectors
+        if len(sample) > sample_size:
+            sample = sample[rng.choice(len(sample), sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), min(n_lists, len(sample)), replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = self._assign(sample, centroids)
+            for list_id in range(len(centroids)):
+                members = sample[labels == list_id]
+                if len(members):
+                    centroids[list_id] = members.sum(axis=0)
+            centroids = normalize_rows(centroids)
+
+        self.centroids = centroids
+        self.assignments = self._assign(self.vectors, centroids)
+        self.trained_size = len(self.vectors)
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk_size=65536):
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk_size):
+            labels[start:start + chunk_size] = np.argmax(
+                vectors[start:start + chunk_size] @ centroids.T, axis=1
+            )
+        return labels
+
+    def search(self, query_vec, k, candidate_ids=None, threshold=None):
+        """
+        Returns the top k (product_id, cosine similarity) pairs for a query vector.
+
+        Args:
+            query_vec: Query vector (any float sequence of the index dimension).
+            k (int): Number of results.
+            candidate_ids: Restrict the search to these products (exact scoring).
+            threshold (float): Drop results whose similarity is not above this value.
+
+        Returns:
+            list: (product_id, similarity) pairs, best first.
+        """
+        query = np.asarray(query_vec, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        with self.lock:
+            vectors, product_ids, rows = self.vectors, self.product_ids, self.rows
+            centroids, assignments = self.centroids, self.assignments
+
+        if candidate_ids is not None:
+            positions = np.fromiter(
+                (rows[product_id] for product_id in dict.fromkeys(
+                    normalize_product_id(candidate_id) for candidate_id in candidate_ids
+                ) if product_id in rows),
+                dtype=np.int64,
+            )
+        elif self.mode == "ivf" and centroids is not None:
+            probe = np.argsort(centroids @ query)[-self.n_probe:]
+            positions = np.flatnonzero(np.isin(assignments, probe))
+        else:
+            positions = np.arange(len(vectors))
+
+        if len(positions) == 0 or k <= 0:
+            return []
+
+        scores = vectors[positions] @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            (product_ids[positions[i]], float(scores[i]))
+            for i in top
+            if threshold is None or scores[i] > threshold
+        ]
+
+
+_product_index = None
+_product_index_lock = threading.Lock()
+
+
+def get_product_index(session, refresh=False):
+    """
+    Returns the process-wide ProductVectorIndex, loading it on first use.
+
+    Args:
+        session: Snowpark session object
+        refresh (bool): Also load embeddings added since the last load.
+
+    Returns:
+        ProductVectorIndex
+    """
+    global _product_index
+
+    with _product_index_lock:
+        if _product_index is None:
+            index = ProductVectorIndex(mode=VECTOR_INDEX_MODE)
+            index.refresh(session)
+            _product_index = index
+            logger.info(f"Loaded {len(index)} product vectors into the {index.mode} index")
+            return index
+
+    if refresh:
+        _product_index.refresh(session)
+    return _product_index
@@ -0,0 +1,78 @@
+import pytest
+
+from mindmart import cache
+from mindmart.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def test_get_returns_default_on_miss():
+    entries = TTLCache()
+    assert entries.get("missing") is None
+    assert entries.get("missing", 42) == 42
+    assert entries.stats()["misses"] == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    entries = TTLCache(ttl=10)
+    entries.set("a", 1)
+    entries.set("b", 2, ttl=60)
+
+    clock.now += 9
+    assert entries.get("a") == 1
+
+    clock.now += 2
+    assert entries.get("a") is None
+    assert entries.get("b") == 2
+    assert entries.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    entries = TTLCache(max_size=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+
+    assert entries.get("b") is None
+    assert entries.get("a") == 1
+    assert entries.get("c") == 3
+    assert len(entries) == 2
+    assert entries.stats()["evictions"] == 1
+
+
+def test_pop_and_clear():
+    entries = TTLCache()
+    entries.set("a", 1)
+    entries.set("b", 2)
+
+    assert entries.pop("a") == 1
+    assert entries.pop("a", "gone") == "gone"
+    entries.clear()
+    assert len(entries) == 0
+
+
+def test_stats_hit_rate():
+    entries = TTLCache()
+    entries.set("a", 1)
+    entries.get("a")
+    entries.get("a")
+    entries.get("b")
+
+    stats = entries.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
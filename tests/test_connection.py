@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from mindmart.connection import SessionPool, report_query_error
+
+
+class FakeSession:
+    def __init__(self):
+        self.healthy = True
+        self.pings = 0
+        self.closed = False
+
+    def sql(self, query):
+        return self
+
+    def collect(self):
+        self.pings += 1
+        if not self.healthy:
+            raise RuntimeError("session expired")
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(SessionPool):
+    def __init__(self, **kwargs):
+        super().__init__({}, **kwargs)
+        self.created = []
+
+    def _create(self):
+        session = FakeSession()
+        self.created.append(session)
+        return session
+
+
+def test_sessions_are_reused():
+    pool = FakePool(size=2, health_check_interval=3600)
+    with pool.checkout() as first:
+        pass
+    with pool.checkout() as second:
+        pass
+    assert second is first
+    assert first.pings == 0
+
+
+def test_checkout_times_out_when_all_sessions_are_in_use():
+    pool = FakePool(size=1, timeout=0.05)
+    with pool.checkout():
+        with pytest.raises(TimeoutError):
+            with pool.checkout():
+                pass
+
+
+def test_checkout_blocks_until_a_session_is_returned():
+    pool = FakePool(size=1, timeout=2)
+    released = threading.Event()
+
+    def hold():
+        with pool.checkout():
+            released.wait(2)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    threading.Timer(0.1, released.set).start()
+    with pool.checkout() as session:
+        assert session is pool.created[0]
+    holder.join()
+
+
+@pytest.mark.parametrize("healthy", [True, False])
+def test_session_is_pinged_after_an_error(healthy):
+    pool = FakePool(health_check_interval=3600)
+    with pytest.raises(ValueError):
+        with pool.checkout() as session:
+            session.healthy = healthy
+            raise ValueError("wrapped by the engine code")
+    assert session.pings == 1
+    assert session.closed is not healthy
+    with pool.checkout() as next_session:
+        assert (next_session is session) is healthy
+
+
+def test_session_is_pinged_after_a_swallowed_query_error():
+    pool = FakePool(health_check_interval=3600)
+    with pool.checkout() as session:
+        session.healthy = False
+        report_query_error(session)
+    assert session.closed
+    with pool.checkout() as next_session:
+        assert next_session is not session
+
+
+def test_idle_session_is_pinged_and_replaced_when_expired():
+    pool = FakePool(health_check_interval=0)
+    with pool.checkout() as session:
+        pass
+    session.healthy = False
+    with pool.checkout() as next_session:
+        pass
+    assert session.pings == 1
+    assert session.closed
+    assert next_session is pool.created[1]
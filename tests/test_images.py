@@ -0,0 +1,136 @@
+import http.client
+import io
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from mindmart import cache, images
+from mindmart.images import ThumbnailCache, ThumbnailRequestHandler, thumbnail_src
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class OriginHandler(SimpleHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """Serves photo.jpg (800x600) from a local HTTP server and records every request."""
+    directory = tmp_path / "origin"
+    directory.mkdir()
+    Image.effect_noise((800, 600), 64).convert("RGB").save(directory / "photo.jpg", "JPEG")
+    OriginHandler.requests = []
+    server = serve(partial(OriginHandler, directory=str(directory)))
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def thumbnails(tmp_path):
+    return ThumbnailCache(directory=str(tmp_path / "thumbnails"))
+
+
+def test_get_fetches_and_resizes_to_every_size(origin, thumbnails):
+    url = f"{origin}/photo.jpg"
+    path = thumbnails.get(url, 200)
+    assert path == thumbnails.path(url, 200)
+    assert Image.open(path).size == (200, 150)
+    assert Image.open(thumbnails.path(url, 400)).size == (400, 300)
+
+    assert thumbnails.get(url, 400) == thumbnails.path(url, 400)
+    assert OriginHandler.requests == ["/photo.jpg"]
+
+
+def test_failed_image_gets_placeholder_and_is_retried_after_interval(origin, thumbnails, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    monkeypatch.setattr(images, "_thumbnail_cache", thumbnails)
+    url = f"{origin}/missing.jpg"
+
+    placeholder = thumbnail_src(url, 200)
+    assert placeholder == thumbnails.placeholder(200)
+    assert Image.open(io.BytesIO(placeholder)).size == (200, 200)
+
+    clock.now += images.THUMBNAIL_RETRY_INTERVAL - 1
+    assert thumbnails.get(url, 200) is None
+    assert OriginHandler.requests == ["/missing.jpg"]
+
+    clock.now += 2
+    assert thumbnails.get(url, 200) is None
+    assert OriginHandler.requests == ["/missing.jpg", "/missing.jpg"]
+
+
+def test_eviction_trims_least_recently_used_to_90_percent(origin, thumbnails):
+    urls = [f"{origin}/photo.jpg?{i}" for i in range(4)]
+    for url in urls[:3]:
+        thumbnails.get(url, 200)
+    image_bytes = thumbnails._total_bytes / 3
+
+    # urls[1] is the oldest image but is read again, which makes urls[0] the LRU
+    for url, mtime in zip(urls[:3], (1000, 500, 3000)):
+        for size in thumbnails.sizes:
+            os.utime(thumbnails.path(url, size), (mtime, mtime))
+    for size in thumbnails.sizes:
+        thumbnails.get(urls[1], size)
+
+    thumbnails.max_bytes = int(image_bytes * 3.5)
+    thumbnails.get(urls[3], 200)
+
+    assert not any(os.path.exists(thumbnails.path(urls[0], size)) for size in thumbnails.sizes)
+    assert all(os.path.exists(thumbnails.path(url, size)) for url in urls[1:] for size in thumbnails.sizes)
+    assert thumbnails._total_bytes <= thumbnails.max_bytes * 0.9
+
+
+@pytest.mark.parametrize("method", ["GET", "HEAD"])
+def test_handler_serves_only_thumbnails(origin, thumbnails, method):
+    url = f"{origin}/photo.jpg"
+    thumbnails.get(url, 200)
+    with open(os.path.join(thumbnails.directory, "notes.txt"), "w") as f:
+        f.write("not a thumbnail")
+
+    server = serve(partial(ThumbnailRequestHandler, directory=thumbnails.directory))
+    try:
+        def request(path):
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+            connection.request(method, path)
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            return response
+
+        response = request(f"/{thumbnails.file_name(url, 200)}")
+        assert response.status == 200
+        assert "immutable" in response.getheader("Cache-Control")
+
+        for path in ("/notes.txt", "/", f"/{thumbnails.file_name(url, 800)}"):
+            response = request(path)
+            assert response.status == 404
+            assert "immutable" not in (response.getheader("Cache-Control") or "")
+    finally:
+        server.shutdown()
+        server.server_close()
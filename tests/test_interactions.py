@@ -0,0 +1,187 @@
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from mindmart import interactions
+from mindmart.interactions import InteractionSpool, interaction_frame, read_segment
+
+
+class FakeWarehouse:
+    """Stands in for write_interactions, recording batches or failing while it is down."""
+
+    def __init__(self):
+        self.batches = []
+        self.attempts = 0
+        self.down = False
+        self.during_write = None
+        self.written = threading.Event()
+
+    def __call__(self, session, rows):
+        self.attempts += 1
+        if self.during_write is not None:
+            self.during_write(rows)
+        if self.down:
+            raise ConnectionError("warehouse unavailable")
+        self.batches.append(rows)
+        self.written.set()
+
+    @property
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+
+@pytest.fixture
+def warehouse(monkeypatch):
+    warehouse = FakeWarehouse()
+    monkeypatch.setattr(interactions, "write_interactions", warehouse)
+    monkeypatch.setattr(interactions, "get_session", contextlib.nullcontext)
+    monkeypatch.setattr(interactions, "bump_profile_version", lambda user_id: None)
+    return warehouse
+
+
+@pytest.fixture
+def spool(warehouse, tmp_path):
+    spool = InteractionSpool(
+        directory=str(tmp_path), batch_size=100, flush_interval=0.05, retry_interval=0.1, orphan_age=600
+    )
+    yield spool
+    # Park the replayer thread, which outlives the test, before the fakes are removed
+    with spool._replay_lock:
+        spool._retry_at = time.monotonic() + 3600
+
+
+def record(event_id, user_id=1, product_id=2):
+    return {
+        "EVENT_ID": event_id,
+        "USER_ID": user_id,
+        "PRODUCT_ID": product_id,
+        "INTERACTION_TYPE": "like",
+        "INTERACTION_TIMESTAMP": "2024-01-02 03:04:05.000000",
+    }
+
+
+def write_segment(directory, name, records, age=0):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        for item in records:
+            f.write(json.dumps(item) + "\n")
+    if age:
+        past = time.time() - age
+        os.utime(path, (past, past))
+    return path
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def spool_files(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_replay_writes_and_removes_segments(warehouse, spool, tmp_path):
+    spool._thread = threading.current_thread()  # Keep the replayer out of this test
+    spool.append(record("a"))
+    spool.append(record("b"))
+
+    assert spool.replay() == 2
+    assert [row[0] for row in warehouse.rows] == ["a", "b"]
+    assert spool_files(tmp_path) == []
+
+
+def test_failed_replay_keeps_segment(warehouse, spool, tmp_path):
+    spool._thread = threading.current_thread()
+    spool.append(record("a"))
+    warehouse.down = True
+
+    assert spool.replay() == 0
+    assert [name.rsplit(".", 1)[1] for name in spool_files(tmp_path)] == ["jsonl"]
+
+    warehouse.down = False
+    assert spool.replay() == 1
+    assert spool_files(tmp_path) == []
+
+
+def test_replayer_retries_after_outage_without_new_appends(warehouse, spool, tmp_path):
+    warehouse.down = True
+    spool.append(record("a"))
+    assert wait_for(lambda: warehouse.attempts >= 1)
+
+    warehouse.down = False
+    assert wait_for(lambda: warehouse.rows)
+    assert [row[0] for row in warehouse.rows] == ["a"]
+    assert wait_for(lambda: spool_files(tmp_path) == [])
+
+
+def test_replayer_backs_off_while_warehouse_is_down(warehouse, spool):
+    warehouse.down = True
+    spool.append(record("a"))
+    time.sleep(0.5)
+
+    # One attempt per retry_interval (0.1s), not a tight loop
+    assert 2 <= warehouse.attempts <= 7
+
+
+def test_replayer_picks_up_orphans_of_dead_processes(warehouse, spool, tmp_path):
+    spool.append(record("a"))
+    assert wait_for(lambda: len(warehouse.rows) == 1)
+
+    write_segment(str(tmp_path), "1-99999-000001.open", [record("b")], age=3600)
+    write_segment(str(tmp_path), "2-99999-000001.replay", [record("c")], age=3600)
+
+    assert wait_for(lambda: len(warehouse.rows) == 3)
+    assert sorted(row[0] for row in warehouse.rows) == ["a", "b", "c"]
+
+
+def test_claimed_old_segment_is_not_taken_for_an_orphan(warehouse, spool, tmp_path):
+    spool._thread = threading.current_thread()
+    other = InteractionSpool(directory=str(tmp_path), orphan_age=600)
+    write_segment(str(tmp_path), "1-99999-000001.jsonl", [record("a")], age=3600)
+
+    def recover_in_other_process(rows):
+        other._recover_orphans()
+        assert spool_files(tmp_path) == ["1-99999-000001.replay"]
+
+    warehouse.during_write = recover_in_other_process
+    assert spool.replay() == 1
+    assert spool_files(tmp_path) == []
+
+
+def test_replayer_survives_segments_removed_by_another_process(warehouse, spool, tmp_path):
+    def remove_claimed(rows):
+        for path in glob.glob(os.path.join(str(tmp_path), "*.replay")):
+            os.remove(path)
+
+    warehouse.during_write = remove_claimed
+    spool.append(record("a"))
+    assert wait_for(lambda: warehouse.attempts >= 1)
+
+    warehouse.during_write = None
+    spool.append(record("b"))
+    assert wait_for(lambda: [row[0] for row in warehouse.rows] == ["a", "b"])
+    assert spool._thread.is_alive()
+
+
+def test_read_segment_skips_torn_lines(tmp_path):
+    path = write_segment(str(tmp_path), "1.jsonl", [record("a")])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"EVENT_ID": "b", "USER')
+
+    assert [row[0] for row in read_segment(path)] == ["a"]
+
+
+def test_interaction_frame_is_typed():
+    df = interaction_frame([("a", 1, 2, "like", "2024-01-02 03:04:05.123456")])
+
+    assert [str(dtype) for dtype in df.dtypes] == ["string", "int64", "int64", "string", "datetime64[ns]"]
+    assert df["INTERACTION_TIMESTAMP"][0].microsecond == 123456
@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import nullcontext
+
+import pandas as pd
+import pytest
+
+from mindmart import pipeline
+from mindmart.cache import TTLCache
+from mindmart.pipeline import run_stage_graph, stream_recommendations
+from mindmart.tracing import recent_traces, traced
+
+
+def test_stages_receive_their_dependencies():
+    results = run_stage_graph({
+        "a": (lambda r: 1, []),
+        "b": (lambda r: 2, []),
+        "sum": (lambda r: r["a"] + r["b"], ["a", "b"]),
+        "double": (lambda r: r["sum"] * 2, ["sum"]),
+    })
+    assert results == {"a": 1, "b": 2, "sum": 3, "double": 6}
+
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(2, timeout=2)
+    results = run_stage_graph({
+        "a": (lambda r: barrier.wait() is not None, []),
+        "b": (lambda r: barrier.wait() is not None, []),
+    })
+    assert results == {"a": True, "b": True}
+
+
+def test_unsatisfiable_dependencies_raise():
+    with pytest.raises(ValueError, match="Unsatisfiable"):
+        run_stage_graph({"a": (lambda r: 1, ["missing"])})
+
+
+def test_failure_waits_for_running_stages_and_skips_dependents():
+    events = []
+
+    def slow(r):
+        time.sleep(0.3)
+        events.append("slow finished")
+
+    def fail(r):
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_stage_graph({
+            "slow": (slow, []),
+            "fail": (fail, []),
+            "after": (lambda r: events.append("after ran"), ["fail", "slow"]),
+        })
+    events.append("raised")
+
+    assert events == ["slow finished", "raised"]
+
+
+def test_stages_are_recorded_as_spans():
+    with traced("search") as trace:
+        run_stage_graph({
+            "search": (lambda r: [1, 2, 3], []),
+            "fetch": (lambda r: r["search"][:2], ["search"]),
+        })
+
+    spans = {span.name: span for span in trace.spans}
+    assert set(spans) == {"search", "fetch"}
+    assert spans["search"].rows == 3
+    assert spans["fetch"].rows == 2
+    assert spans["fetch"].start >= spans["search"].start + spans["search"].duration
+
+
+class FakeSearch:
+    """Stands in for the pipeline and the preview search; the pipeline blocks until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.finished = threading.Event()
+        self.calls = []
+
+    def recommend(self, session, human_query, user_id):
+        self.calls.append("final")
+        self.release.wait(2)
+        self.finished.set()
+        return pd.DataFrame({"PRODUCT_ID": [1, 2]})
+
+    def preview(self, session, query, limit=None):
+        self.calls.append("preview")
+        return pd.DataFrame({"PRODUCT_ID": [3]})
+
+
+@pytest.fixture
+def search(monkeypatch):
+    search = FakeSearch()
+    monkeypatch.setattr(pipeline, "get_recommendations", search.recommend)
+    monkeypatch.setattr(pipeline, "search_products", search.preview)
+    monkeypatch.setattr(pipeline, "remember_products", lambda df: None)
+    monkeypatch.setattr(pipeline, "_recommendation_cache", TTLCache())
+    return search
+
+
+def test_stream_yields_preview_before_final(search):
+    stream = stream_recommendations(None, "shoes", 1)
+
+    stage, df = next(stream)
+    assert stage == "preview"
+    assert df["PRODUCT_ID"].tolist() == [3]
+
+    search.release.set()
+    stage, df = next(stream)
+    assert stage == "final"
+    assert df["PRODUCT_ID"].tolist() == [1, 2]
+    with pytest.raises(StopIteration):
+        next(stream)
+
+    trace = recent_traces()[0]
+    assert trace["attributes"]["streamed"]
+    assert {"cache", "preview"} <= {span["name"] for span in trace["spans"]}
+
+
+def test_closing_stream_waits_for_final_search(search):
+    stream = stream_recommendations(None, "shoes", 1)
+    assert next(stream)[0] == "preview"
+
+    threading.Timer(0.2, search.release.set).start()
+    stream.close()
+    assert search.finished.is_set()
+
+
+def test_cached_stream_yields_only_final_and_looks_up_once(search):
+    search.release.set()
+    assert [stage for stage, _ in stream_recommendations(None, "shoes", 1)][-1] == "final"
+
+    results = list(stream_recommendations(None, "Shoes ", 1))
+    assert [stage for stage, _ in results] == ["final"]
+    assert results[0][1]["PRODUCT_ID"].tolist() == [1, 2]
+    assert search.calls.count("final") == 1
+
+    stats = pipeline._recommendation_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_store_upkeep_is_traced(monkeypatch):
+    monkeypatch.setattr(pipeline, "get_session", nullcontext)
+    monkeypatch.setattr(pipeline, "refresh_product_embeddings", lambda session: False)
+    monkeypatch.setattr(pipeline, "_store_upkeep_due_at", 0.0)
+
+    pipeline.run_store_upkeep()
+
+    trace = recent_traces()[0]
+    assert trace["name"] == "upkeep"
+    assert [span["name"] for span in trace["spans"]] == ["embeddings"]
+    assert pipeline._store_upkeep_due_at > time.monotonic()
@@ -0,0 +1,63 @@
+import pytest
+
+from mindmart import rewrite
+from mindmart.cache import TTLCache
+from mindmart.rewrite import QueryRewriteStore, get_mistral_query, normalize_query, rewrite_cache_key
+
+
+class FakeCortex:
+    """Stands in for execute_statement, answering every COMPLETE call with one rewrite."""
+
+    def __init__(self, response="red running shoes"):
+        self.response = response
+        self.calls = 0
+
+    def __call__(self, session, name, params=(), to_pandas=False):
+        assert name == "rewrite_query"
+        self.calls += 1
+        return [{"RESPONSE": f"  {self.response}\n"}]
+
+
+@pytest.fixture
+def cortex(monkeypatch, tmp_path):
+    cortex = FakeCortex()
+    monkeypatch.setattr(rewrite, "execute_statement", cortex)
+    monkeypatch.setattr(rewrite, "_rewrite_cache", TTLCache())
+    monkeypatch.setattr(rewrite, "_rewrite_store", QueryRewriteStore(str(tmp_path / "rewrites.sqlite3"), 3600))
+    monkeypatch.setattr(rewrite, "_rewrite_store_hits", 0)
+    return cortex
+
+
+def test_normalize_query_ignores_case_quotes_and_whitespace():
+    assert normalize_query('  Red  "Running" SHOES ') == "red running shoes"
+    assert rewrite_cache_key("Red running shoes") == rewrite_cache_key(" red 'running'  shoes")
+
+
+def test_rewrite_is_cached_in_memory(cortex):
+    assert get_mistral_query(None, "Red running shoes") == "red running shoes"
+    assert get_mistral_query(None, "red  RUNNING shoes") == "red running shoes"
+    assert cortex.calls == 1
+    assert rewrite.rewrite_cache_stats()["llm_calls"] == 1
+
+
+def test_rewrite_is_read_back_from_disk(cortex, monkeypatch):
+    get_mistral_query(None, "Red running shoes")
+    monkeypatch.setattr(rewrite, "_rewrite_cache", TTLCache())
+
+    assert get_mistral_query(None, "Red running shoes") == "red running shoes"
+    assert cortex.calls == 1
+    assert rewrite.rewrite_cache_stats()["disk_hits"] == 1
+
+
+def test_prompt_version_change_invalidates_rewrites(cortex, monkeypatch):
+    get_mistral_query(None, "Red running shoes")
+    monkeypatch.setattr(rewrite, "REWRITE_PROMPT_VERSION", rewrite.REWRITE_PROMPT_VERSION + 1)
+
+    get_mistral_query(None, "Red running shoes")
+    assert cortex.calls == 2
+
+
+def test_store_ignores_expired_rewrites(tmp_path):
+    store = QueryRewriteStore(str(tmp_path / "rewrites.sqlite3"), ttl=-1)
+    store.set("key", "query", "rewrite")
+    assert store.get("key") is None
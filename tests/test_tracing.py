@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from mindmart.connection import _clear_query_error
+from mindmart.tracing import bind_trace, current_trace, recent_traces, run_query, span, traced
+
+
+class FakeSession:
+    pass
+
+
+class FakeJob:
+    def __init__(self, query_id, result):
+        self.query_id = query_id
+        self._result = result
+
+    def result(self):
+        if isinstance(self._result, Exception):
+            raise self._result
+        return self._result
+
+
+class FakeFrame:
+    """Stands in for a Snowpark DataFrame whose query gets the given ID."""
+
+    def __init__(self, query_id, result):
+        self.session = FakeSession()
+        self.job = FakeJob(query_id, result)
+
+    def collect_nowait(self):
+        return self.job
+
+    def to_pandas(self, block=True):
+        return self.job
+
+
+def test_span_records_result_and_error():
+    with traced("search") as trace:
+        with span("frame") as item:
+            item.record_result(pd.DataFrame({"A": [1, 2, 3]}))
+        with span("ids") as item:
+            item.record_result([1, 2])
+        with pytest.raises(ValueError):
+            with span("broken"):
+                raise ValueError("bad row")
+
+    spans = {item.name: item for item in trace.spans}
+    assert (spans["frame"].rows, spans["ids"].rows) == (3, 2)
+    assert spans["frame"].bytes > 0
+    assert spans["broken"].error == "bad row"
+    assert all(item.duration is not None for item in trace.spans)
+
+
+def test_run_query_attributes_query_ids_to_the_current_span():
+    with traced("search") as trace:
+        with span("search"):
+            assert run_query(FakeFrame("01-a", ["row"])) == ["row"]
+            run_query(FakeFrame("01-b", pd.DataFrame()), to_pandas=True)
+    assert trace.spans[0].query_ids == ["01-a", "01-b"]
+
+
+def test_failed_query_is_reported_to_the_session_pool():
+    frame = FakeFrame("01-c", RuntimeError("connection reset"))
+    with pytest.raises(RuntimeError):
+        run_query(frame)
+    assert _clear_query_error(frame.session)
+    assert not _clear_query_error(frame.session)
+
+
+def test_nested_traced_joins_the_current_trace():
+    with traced("search", query="shoes") as outer:
+        with traced("search") as inner:
+            assert inner is outer
+        with span("rewrite"):
+            pass
+    assert current_trace() is None
+
+    latest = recent_traces()[0]
+    assert latest["trace_id"] == outer.trace_id
+    assert latest["attributes"] == {"query": "shoes"}
+    assert [item["name"] for item in latest["spans"]] == ["rewrite"]
+
+
+def test_bind_trace_records_spans_from_other_threads():
+    def stage():
+        with span("stage"):
+            return current_trace()
+
+    with traced("search") as trace:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="worker") as executor:
+            assert executor.submit(bind_trace(stage)).result() is trace
+            assert executor.submit(stage).result() is None
+
+    assert [item.name for item in trace.spans] == ["stage"]
+    assert trace.spans[0].thread.startswith("worker")
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mindmart.vector_index import ProductVectorIndex, as_vector
+
+
+class FakeJob:
+    query_id = "01-fake"
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+class FakeSession:
+    """Serves PRODUCT_EMBEDDINGS rows to ProductVectorIndex.refresh, one frame per read."""
+
+    def __init__(self, *frames):
+        self.frames = list(frames)
+        self.queries = []
+
+    def sql(self, query):
+        self.queries.append(query)
+        return self
+
+    def to_pandas(self, block=True):
+        frame = self.frames.pop(0) if self.frames else pd.DataFrame()
+        return frame if block else FakeJob(frame)
+
+    def collect(self):
+        return []
+
+
+def embeddings_frame(vectors, embedded_at="2024-01-01 00:00:00"):
+    return pd.DataFrame({
+        "PRODUCT_ID": [str(product_id) for product_id in vectors],
+        "PRODUCT_VEC": [list(vector) for vector in vectors.values()],
+        "EMBEDDED_AT": [embedded_at] * len(vectors),
+    })
+
+
+@pytest.fixture
+def index():
+    index = ProductVectorIndex(dimensions=3)
+    index.refresh(FakeSession(embeddings_frame({
+        1: [1.0, 0.0, 0.0],
+        2: [0.8, 0.6, 0.0],
+        3: [0.0, 1.0, 0.0],
+        4: [0.0, 0.0, 1.0],
+    })))
+    return index
+
+
+def test_as_vector_accepts_json_strings():
+    assert as_vector("[1, 2.5]").tolist() == [1.0, 2.5]
+
+
+def test_exact_search_ranks_by_cosine(index):
+    results = index.search([2.0, 0.0, 0.0], 3)
+
+    assert [product_id for product_id, _ in results] == [1, 2, 3]
+    assert results[0][1] == pytest.approx(1.0)
+    assert results[1][1] == pytest.approx(0.8)
+
+
+def test_search_within_candidates_and_threshold(index):
+    results = index.search([1.0, 0.0, 0.0], 10, candidate_ids=["4", "2", 3, 99], threshold=0.0)
+    assert [product_id for product_id, _ in results] == [2]
+
+
+def test_zero_query_returns_nothing(index):
+    assert index.search([0.0, 0.0, 0.0], 3) == []
+
+
+def test_refresh_loads_only_new_and_changed_embeddings(index):
+    session = FakeSession(embeddings_frame({3: [0.0, 0.0, 1.0], 5: [0.0, 1.0, 0.0]}, "2024-01-02 00:00:00"))
+
+    assert index.refresh(session) == 2
+    assert "EMBEDDED_AT > '2024-01-01 00:00:00'" in session.queries[-1]
+    assert len(index) == 5
+    assert {product_id for product_id, _ in index.search([0.0, 0.0, 1.0], 2)} == {3, 4}
+    assert index.search([0.0, 1.0, 0.0], 1)[0][0] == 5
+
+
+def test_ivf_search_finds_the_nearest_cluster():
+    rng = np.random.default_rng(1)
+    centers = np.eye(4, 16, dtype=np.float32)
+    vectors = {}
+    for cluster, center in enumerate(centers):
+        for i in range(50):
+            vectors[cluster * 100 + i] = center + rng.normal(0, 0.05, 16)
+
+    index = ProductVectorIndex(mode="ivf", n_lists=4, n_probe=1, dimensions=16)
+    index.refresh(FakeSession(embeddings_frame(vectors)))
+    exact = ProductVectorIndex(dimensions=16)
+    exact.refresh(FakeSession(embeddings_frame(vectors)))
+
+    query = centers[2] + rng.normal(0, 0.05, 16)
+    results = index.search(query, 10)
+
+    assert index.centroids is not None
+    assert all(200 <= product_id < 300 for product_id, _ in results)
+    assert [product_id for product_id, _ in results] == [product_id for product_id, _ in exact.search(query, 10)]